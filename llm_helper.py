@@ -6,11 +6,25 @@ Used by positive_influence_llm.nlogo via the NetLogo Python extension.
 """
 
 import os
+import io
+import asyncio
+import collections
+import functools
 import json
 import random
 import re
-import urllib.request
+import email.utils
+import hashlib
+import socket
+import sqlite3
+import ssl
+import threading
+import time
+import http.client
+import urllib.parse
 import urllib.error
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 # ── Global state ──────────────────────────────────────────────────────────────
 
@@ -18,17 +32,53 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MEMORY_DIR = os.path.join(SCRIPT_DIR, "agent_memories")
 TRANSCRIPT_PATH = os.path.join(SCRIPT_DIR, "transcript.txt")
 PARSE_LOG_PATH = os.path.join(SCRIPT_DIR, "parse_failures.log")
+PROMPT_CACHE_LOG_PATH = os.path.join(SCRIPT_DIR, "prompt_cache.log")
+KV_LOG_PATH = os.path.join(SCRIPT_DIR, "kv_cache.log")
+BUDGET_LOG_PATH = os.path.join(SCRIPT_DIR, "budget.log")
+CALLS_LOG_PATH = None  # per-call telemetry (llm_calls.jsonl); set by setup_agents
+EVENTS_LOG_PATH = None  # asynchronous activation events (events.jsonl); set by setup_agents
 
 _parse_attempts = 0
 _parse_failures = 0
+_parse_lock = threading.Lock()  # conversations may be scored concurrently
+
+# Token usage summed over all calls since setup (see get_usage_stats)
+_usage_totals = collections.Counter()
+_usage_lock = threading.Lock()
+
+# Client-side event counters since setup: retries, breaker trips, ... (see get_metrics)
+_metrics = collections.Counter()
+_metrics_lock = threading.Lock()
 
 _topic = ""
 _model = "phi3:mini"
+_temperature = 0.8
+_seed = None         # sampling seed sent to Ollama (None = unseeded)
 _memory_length = 5
+# Token budget for the memory injected into each prompt (0 = entry count only)
+_memory_tokens = int(os.environ.get("LLM_MEMORY_TOKENS", "0"))
 _num_agents = 25
-_ollama_url = os.environ.get("OLLAMA_URL", "http://localhost:11434")
-_backend = "ollama"  # "ollama" or "claude"
+_backend = "ollama"  # "ollama", "claude", "claude-batch" or "openai"
+_kv_reuse = False    # carry Ollama KV-cache context between an agent's turns
+_keep_alive = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")  # how long Ollama keeps the model loaded
+_scoring_mode = "text"  # "text" (blocking), "stream" (stop once both opinions parse) or "json"
+_dialogue_mode = "turns"  # "turns" (one call per turn), "compact" or "combined"
+_early_exit = False  # end turn-by-turn conversations early once more turns add little
+# Seconds one run_conversation may spend on LLM calls (0 = no budget)
+_conversation_budget = float(os.environ.get("LLM_CONVERSATION_BUDGET", "0"))
 _claude_api_key = ""
+_claude_url = os.environ.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+# OpenAI-compatible server (vLLM, llama.cpp server, LM Studio, ...), up to /v1
+_openai_url = os.environ.get("OPENAI_BASE_URL", "http://localhost:8000/v1").rstrip("/")
+_openai_api_key = os.environ.get("OPENAI_API_KEY", "")
+_batch_poll_interval = float(os.environ.get("CLAUDE_BATCH_POLL_INTERVAL", "30"))
+_batch_timeout = float(os.environ.get("CLAUDE_BATCH_TIMEOUT", str(24 * 3600)))
+_pool_size = int(os.environ.get("LLM_POOL_SIZE", "4"))
+_pool_idle_timeout = float(os.environ.get("LLM_POOL_IDLE_TIMEOUT", "30"))
+_max_concurrency = int(os.environ.get("LLM_MAX_CONCURRENCY",
+                                      os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+# Conversations pipeline_conversations keeps in flight at once
+_pipeline_depth = int(os.environ.get("LLM_PIPELINE_DEPTH", "2"))
 
 _SYSTEM_PROMPT = (
     "You are a character in an academic opinion dynamics research simulation. "
@@ -57,96 +107,1957 @@ def _load_env():
                 env_vars[key.strip()] = value
     return env_vars
 
+# ── HTTP transport ───────────────────────────────────────────────────────────
+
+# Errors that mean a pooled keep-alive socket was closed by the server while it
+# sat idle. A request that hits one of these on a reused connection is retried
+# once on a fresh connection before the error is surfaced.
+_STALE_SOCKET_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
 
-# ── LLM API ──────────────────────────────────────────────────────────────────
 
-def call_llm(prompt, model=None, num_predict=300):
-    """Route to the active backend (Ollama or Claude)."""
-    if _backend == "claude":
-        return call_claude(prompt, model=model, max_tokens=num_predict)
-    return call_ollama(prompt, model=model, num_predict=num_predict)
+class _ConnectionPool:
+    """Keep-alive HTTP(S) connections shared by every backend.
 
+    Idle connections are kept per (scheme, host, port), at most `max_size` per
+    host, and are closed once they have been idle for `idle_timeout` seconds.
+    """
 
-def call_ollama(prompt, model=None, num_predict=300):
-    """Send a prompt to the Ollama /api/generate endpoint and return the response text."""
+    def __init__(self, max_size, idle_timeout):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = None
+
+    def acquire(self, scheme, host, port, timeout):
+        """Return (connection, reused) for the given origin."""
+        key = (scheme, host, port)
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    conn = candidate
+                    break
+                stale.append(candidate)
+        for old in stale:
+            old.close()
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout,
+                                               context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def release(self, scheme, host, port, conn):
+        """Return a healthy connection to the pool (or close it if the pool is full)."""
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_size:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def close_all(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+
+_pool = _ConnectionPool(_pool_size, _pool_idle_timeout)
+
+
+def configure_http_pool(pool_size=None, idle_timeout=None):
+    """Change the keep-alive pool size (idle connections per host) and idle timeout (seconds)."""
+    global _pool_size, _pool_idle_timeout
+    if pool_size is not None:
+        _pool_size = int(pool_size)
+        _pool.max_size = _pool_size
+    if idle_timeout is not None:
+        _pool_idle_timeout = float(idle_timeout)
+        _pool.idle_timeout = _pool_idle_timeout
+    _pool.close_all()
+
+
+class _Cancellation:
+    """Lets another thread abort an in-flight request by shutting down its socket."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise ConnectionAbortedError("request cancelled")
+            self._conn = conn
+
+    def detach(self):
+        """Forget the connection; return False if the request was cancelled meanwhile."""
+        with self._lock:
+            self._conn = None
+            return not self.cancelled
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            conn, self._conn = self._conn, None
+        if conn is not None and conn.sock is not None:
+            try:
+                # Unlike close(), shutdown wakes a thread blocked reading the socket
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _http_request(method, url, body=None, headers=None, timeout=120, cancel=None):
+    """Send an HTTP request over a pooled keep-alive connection.
+
+    Returns (status, headers, body_bytes). Raises urllib.error.HTTPError for
+    4xx/5xx responses so callers can keep handling errors as with urlopen.
+    `cancel` is an optional _Cancellation through which another thread can
+    abort the request.
+    """
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme or "http"
+    host = parts.hostname
+    port = parts.port or (443 if scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    headers = dict(headers or {})
+
+    for attempt in range(2):
+        conn, reused = _pool.acquire(scheme, host, port, timeout)
+        try:
+            if cancel is not None:
+                if conn.sock is None:
+                    conn.connect()
+                cancel.attach(conn)
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except _STALE_SOCKET_ERRORS:
+            conn.close()
+            if reused and attempt == 0 and not (cancel is not None and cancel.cancelled):
+                continue
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close or (cancel is not None and not cancel.detach()):
+            conn.close()
+        else:
+            _pool.release(scheme, host, port, conn)
+        if resp.status >= 400:
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers,
+                                         io.BytesIO(data))
+        return resp.status, resp.headers, data
+
+
+def _http_stream_lines(method, url, body=None, headers=None, timeout=120):
+    """Send a request over the pool and yield the response body line by line.
+
+    Closing the generator before the body is exhausted (e.g. to stop a
+    generation early) closes the connection instead of returning it to the pool.
+    """
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme or "http"
+    host = parts.hostname
+    port = parts.port or (443 if scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    for attempt in range(2):
+        conn, reused = _pool.acquire(scheme, host, port, timeout)
+        try:
+            conn.request(method, path, body=body, headers=dict(headers or {}))
+            resp = conn.getresponse()
+        except _STALE_SOCKET_ERRORS:
+            conn.close()
+            if reused and attempt == 0:
+                continue
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        break
+
+    if resp.status >= 400:
+        data = resp.read()
+        conn.close()
+        raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers,
+                                     io.BytesIO(data))
+    finished = False
+    try:
+        while True:
+            line = resp.readline()
+            if not line:
+                break
+            yield line
+        finished = True
+    finally:
+        if finished and not resp.will_close:
+            _pool.release(scheme, host, port, conn)
+        else:
+            conn.close()
+
+
+def _post_json(url, payload, headers=None, timeout=120, cancel=None):
+    """POST a JSON payload over the shared pool and return the decoded JSON response."""
+    all_headers = {"Content-Type": "application/json"}
+    all_headers.update(headers or {})
+    _, _, data = _http_request("POST", url, json.dumps(payload).encode("utf-8"),
+                               all_headers, timeout, cancel)
+    return json.loads(data.decode("utf-8"))
+
+
+def _get_json(url, headers=None, timeout=120):
+    """GET a URL over the shared pool and return the decoded JSON response."""
+    _, _, data = _http_request("GET", url, headers=headers, timeout=timeout)
+    return json.loads(data.decode("utf-8"))
+
+
+# ── Response cache ───────────────────────────────────────────────────────────
+#
+# Optional content-addressed cache in front of call_llm, stored in SQLite. A
+# response is keyed by everything that determines it (backend, model, system
+# prompt, prompt, temperature, seed, num_predict); the least recently used
+# entries are evicted once the stored responses exceed `max_bytes`.
+
+class _ResponseCache:
+    """SQLite-backed LRU store of LLM responses."""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)"
+        )
+        self._db.commit()
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?",
+                             (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key, response):
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?",
+                                   (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) "
+                "VALUES (?, ?, ?, ?)", (key, response, size, time.time()))
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is 90% full."""
+        target = self.max_bytes * 0.9
+        rows = self._db.execute(
+            "SELECT key, size FROM responses ORDER BY last_access").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            doomed.append((key,))
+            self._size -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {"path": self.path, "entries": entries, "bytes": self._size,
+                    "max_bytes": self.max_bytes, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_response_cache = None
+
+
+def configure_response_cache(path=None, max_bytes=None):
+    """Enable the on-disk response cache at `path` (None disables it).
+
+    max_bytes bounds the total size of stored responses (default: the
+    LLM_CACHE_MAX_MB environment variable, else 256 MB).
+    """
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.close()
+        _response_cache = None
+    if path:
+        if max_bytes is None:
+            max_bytes = float(os.environ.get("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+        _response_cache = _ResponseCache(path, int(max_bytes))
+        print(f"[llm_helper] Response cache: {path}")
+
+
+def get_response_cache_stats():
+    """Return hit/miss/eviction counters and size of the response cache (None if off)."""
+    if _response_cache is None:
+        return None
+    return _response_cache.stats()
+
+
+def _cache_key(model, prompt, num_predict):
+    backend = "claude" if _backend.startswith("claude") else _backend
+    material = json.dumps([backend, model, _SYSTEM_PROMPT, prompt, _temperature,
+                           _seed, num_predict])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+if os.environ.get("LLM_CACHE_PATH"):
+    configure_response_cache(os.environ["LLM_CACHE_PATH"])
+
+
+# ── Retry policy and circuit breaker ─────────────────────────────────────────
+#
+# Every backend request runs under one policy: up to `_retry_max_attempts`
+# attempts separated by decorrelated-jitter backoff (or the server's
+# Retry-After on 429/503/529), all within a per-call deadline. A per-backend
+# circuit breaker opens after `_breaker_threshold` consecutive failed attempts
+# and makes calls fail fast (callers fall back) until a probe succeeds.
+
+_retry_max_attempts = int(os.environ.get("LLM_RETRY_ATTEMPTS", "4"))
+_retry_base_delay = float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5"))
+_retry_max_delay = float(os.environ.get("LLM_RETRY_MAX_DELAY", "20"))
+_request_timeout = float(os.environ.get("LLM_REQUEST_TIMEOUT", "120"))
+_call_deadline = float(os.environ.get("LLM_CALL_DEADLINE", "180"))
+_breaker_threshold = int(os.environ.get("LLM_BREAKER_THRESHOLD", "5"))
+_breaker_cooldown = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+
+# Statuses worth retrying; any other 4xx is a request bug that will not go away
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+# Statuses that mean "slow down" rather than "backend broken"
+_THROTTLE_STATUS = {429, 529}
+
+# Separate RNG so backoff jitter never perturbs the simulation's random stream
+_retry_rng = random.Random()
+
+
+def _count(name, amount=1):
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+def get_metrics():
+    """Return client-side event counters since setup (retries, breaker trips, ...)."""
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+class _CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open -> closed)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a request may be sent now."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= _breaker_cooldown:
+                # Let exactly one probe through; its outcome decides the state
+                self.state = "half_open"
+                self.probe_at = now
+                return True
+            if self.state == "half_open" and now - self.probe_at >= _breaker_cooldown:
+                # The probe never reported back; treat it as failed
+                self.state = "open"
+                self.opened_at = now
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"[llm_helper] {self.name} circuit breaker closed")
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed"
+                                             and self.failures >= _breaker_threshold):
+                if self.state == "closed":
+                    print(f"[llm_helper] {self.name} circuit breaker open after "
+                          f"{self.failures} consecutive failures — failing fast for "
+                          f"{_breaker_cooldown:g}s")
+                    _count("breaker_opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+
+
+def _breaker(name):
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers.setdefault(name, _CircuitBreaker(name))
+    return breaker
+
+
+def configure_retry(max_attempts=None, base_delay=None, max_delay=None, request_timeout=None,
+                    call_deadline=None, breaker_threshold=None, breaker_cooldown=None):
+    """Change the retry policy and circuit breaker settings (None keeps a setting)."""
+    global _retry_max_attempts, _retry_base_delay, _retry_max_delay, _request_timeout
+    global _call_deadline, _breaker_threshold, _breaker_cooldown
+    if max_attempts is not None:
+        _retry_max_attempts = max(1, int(max_attempts))
+    if base_delay is not None:
+        _retry_base_delay = float(base_delay)
+    if max_delay is not None:
+        _retry_max_delay = float(max_delay)
+    if request_timeout is not None:
+        _request_timeout = float(request_timeout)
+    if call_deadline is not None:
+        _call_deadline = float(call_deadline)
+    if breaker_threshold is not None:
+        _breaker_threshold = max(1, int(breaker_threshold))
+    if breaker_cooldown is not None:
+        _breaker_cooldown = float(breaker_cooldown)
+
+
+def _retry_after_seconds(error):
+    """Seconds to wait according to an HTTP error's Retry-After header, or None."""
+    headers = getattr(error, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _with_retries(name, label, send, deadline=None):
+    """Call send(timeout) under the retry policy and `name`'s circuit breaker.
+
+    `deadline` is an absolute time.monotonic() value; the call never runs past
+    it (nor past the per-call deadline). Returns send's result, or None once
+    the attempts, the deadline or the breaker say to give up.
+    """
+    if deadline is not None and time.monotonic() >= deadline:
+        # The caller's budget is already spent; fail without touching the backend
+        _count("deadline_exceeded")
+        return None
+    breaker = _breaker(name)
+    if not breaker.allow():
+        _count("breaker_rejected")
+        return None
+    start = time.monotonic()
+    end = start + _call_deadline
+    if deadline is not None:
+        end = min(end, deadline)
+    delay = _retry_base_delay
+    for attempt in range(1, _retry_max_attempts + 1):
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            _count("deadline_exceeded")
+            break
+        retry_after = None
+        timeout = min(_request_timeout, remaining)
+        try:
+            result = send(timeout)
+        except _PacingTimeout as e:
+            # Nothing was sent, so this says nothing about the backend
+            print(f"[llm_helper] {label}: {e} — giving up")
+            _count("deadline_exceeded")
+            break
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode("utf-8", errors="replace")[:500]
+            print(f"[llm_helper] {label} error (attempt {attempt}/{_retry_max_attempts}): {e}")
+            if detail:
+                print(f"[llm_helper] Response: {detail}")
+            if e.code not in _RETRYABLE_STATUS:
+                # The backend is up; the request itself is bad
+                breaker.record_success()
+                _count("calls_failed")
+                return None
+            if e.code in _THROTTLE_STATUS or e.code == 503:
+                retry_after = _retry_after_seconds(e)
+            if e.code in _THROTTLE_STATUS:
+                _count("throttled")
+            else:
+                breaker.record_failure()
+        except (urllib.error.URLError, TimeoutError, ConnectionError, OSError,
+                http.client.HTTPException) as e:
+            print(f"[llm_helper] {label} connection error (attempt {attempt}/{_retry_max_attempts}): {e}")
+            # A timeout shortened by the caller's deadline says nothing about the backend
+            if not (isinstance(e, (socket.timeout, TimeoutError)) and timeout < _request_timeout):
+                breaker.record_failure()
+        except ValueError as e:
+            # A body that does not decode, e.g. a proxy's HTML error page with status 200
+            print(f"[llm_helper] {label} invalid response (attempt {attempt}/{_retry_max_attempts}): {e}")
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+            return result
+        _count("failed_attempts")
+        if attempt == _retry_max_attempts:
+            break
+        if not breaker.allow():
+            _count("breaker_rejected")
+            break
+        # Decorrelated jitter: each wait is drawn from [base, 3 * previous wait]
+        delay = min(_retry_max_delay, _retry_rng.uniform(_retry_base_delay, delay * 3))
+        wait = delay
+        if retry_after is not None:
+            wait = retry_after
+            _count("retry_after_waits")
+        if time.monotonic() + wait >= end:
+            _count("deadline_exceeded")
+            break
+        _count("retries")
+        time.sleep(wait)
+    print(f"[llm_helper] {label} request failed after {attempt} attempt(s) "
+          f"in {time.monotonic() - start:.1f}s")
+    _count("calls_failed")
+    return None
+
+
+# ── Claude rate limiting ─────────────────────────────────────────────────────
+#
+# Client-side token buckets for the Claude API's requests-per-minute,
+# input-tokens-per-minute and output-tokens-per-minute limits. Each request
+# reserves its estimated cost up front (prompt size, and max_tokens for the
+# output) and waits if a bucket is in debt; once the response arrives the
+# estimate is corrected with the actual `usage`. Requests are thus paced just
+# under the limits instead of bursting into 429s and backing off. A limit of
+# 0 disables that bucket.
+
+_claude_rpm = float(os.environ.get("CLAUDE_RPM", "0"))
+_claude_itpm = float(os.environ.get("CLAUDE_ITPM", "0"))
+_claude_otpm = float(os.environ.get("CLAUDE_OTPM", "0"))
+_RATE_LIMIT_HEADROOM = 0.95
+# Burst allowance in seconds of refill: the API may enforce a per-minute limit
+# over shorter intervals, so a full minute's worth is never sent at once
+_RATE_LIMIT_BURST_SECONDS = 6.0
+
+
+def _estimate_tokens(text):
+    """Rough token count for English text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+class _TokenBucket:
+    """Token bucket refilled continuously at `per_minute` units per minute.
+
+    Reservations may drive the level negative; the reserving caller then waits
+    until the debt has been refilled, which paces callers in arrival order.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute * _RATE_LIMIT_HEADROOM / 60.0
+        self.capacity = self.rate * _RATE_LIMIT_BURST_SECONDS
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take `amount` units; return the seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.level -= amount
+            return -self.level / self.rate if self.level < 0 else 0.0
+
+    def adjust(self, amount):
+        """Give back (negative amount) or take more (positive) after the fact."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level - amount)
+
+
+class _PacingTimeout(Exception):
+    """The rate limiter's wait would outlast the request's time allowance."""
+
+
+class _RateLimiter:
+    def __init__(self, rpm, input_tpm, output_tpm):
+        self.requests = _TokenBucket(rpm) if rpm > 0 else None
+        self.input_tokens = _TokenBucket(input_tpm) if input_tpm > 0 else None
+        self.output_tokens = _TokenBucket(output_tpm) if output_tpm > 0 else None
+
+    def acquire(self, input_tokens, output_tokens, max_wait=None):
+        """Reserve one request's estimated cost, sleeping until it is affordable.
+
+        Returns the seconds slept. If that would be more than `max_wait`, the
+        reservation is given back and _PacingTimeout is raised instead.
+        """
+        wait = 0.0
+        reserved = []
+        for bucket, amount in ((self.requests, 1), (self.input_tokens, input_tokens),
+                               (self.output_tokens, output_tokens)):
+            if bucket is not None:
+                wait = max(wait, bucket.reserve(amount))
+                reserved.append((bucket, amount))
+        if max_wait is not None and wait > max_wait:
+            for bucket, amount in reserved:
+                bucket.adjust(-amount)
+            _count("rate_limit_deadline")
+            raise _PacingTimeout(f"rate limit wait of {wait:.1f}s exceeds the "
+                                 f"{max_wait:.1f}s left")
+        if wait > 0:
+            _count("rate_limit_waits")
+            _count("rate_limit_wait_seconds", wait)
+            time.sleep(wait)
+        return wait
+
+    def reconcile(self, estimated_input, estimated_output, actual_input, actual_output):
+        if self.input_tokens is not None:
+            self.input_tokens.adjust(actual_input - estimated_input)
+        if self.output_tokens is not None:
+            self.output_tokens.adjust(actual_output - estimated_output)
+
+
+_claude_limiter = _RateLimiter(_claude_rpm, _claude_itpm, _claude_otpm)
+
+
+def configure_rate_limit(rpm=None, input_tpm=None, output_tpm=None):
+    """Set the Claude API limits to pace under (per minute; 0 disables a limit)."""
+    global _claude_rpm, _claude_itpm, _claude_otpm, _claude_limiter
+    if rpm is not None:
+        _claude_rpm = float(rpm)
+    if input_tpm is not None:
+        _claude_itpm = float(input_tpm)
+    if output_tpm is not None:
+        _claude_otpm = float(output_tpm)
+    _claude_limiter = _RateLimiter(_claude_rpm, _claude_itpm, _claude_otpm)
+
+
+def _claude_payload_tokens(payload):
+    """Estimate a Messages API payload's (input, output) token cost."""
+    text = ""
+    system = payload.get("system", "")
+    blocks = system if isinstance(system, list) else [{"text": system}]
+    for message in payload.get("messages", []):
+        content = message["content"]
+        blocks = blocks + (content if isinstance(content, list) else [{"text": content}])
+    for block in blocks:
+        text += block.get("text", "")
+    return _estimate_tokens(text), payload.get("max_tokens", 0)
+
+
+# ── Ollama endpoints ─────────────────────────────────────────────────────────
+#
+# One simulation can spread its Ollama calls over several servers running the
+# same model. Each request goes to the healthy endpoint with the fewest
+# requests outstanding (ties broken by recent latency). An endpoint that fails
+# `_eject_after` requests in a row is ejected; a background thread probes
+# ejected endpoints every `_health_interval` seconds and re-admits them once
+# they answer again.
+
+_eject_after = int(os.environ.get("OLLAMA_EJECT_AFTER", "3"))
+_health_interval = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "10"))
+
+
+class _Endpoint:
+    """One Ollama server and its load and latency statistics."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected = False
+        self.ewma_latency = 0.0
+        self.latencies = collections.deque(maxlen=500)
+
+    def stats(self):
+        ordered = sorted(self.latencies)
+
+        def pct(q):
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+        return {
+            "url": self.url,
+            "healthy": not self.ejected,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "mean_latency": sum(ordered) / len(ordered) if ordered else 0.0,
+            "p50_latency": pct(0.50),
+            "p95_latency": pct(0.95),
+        }
+
+
+class _EndpointPool:
+    """Least-outstanding-requests balancer with passive ejection and active re-admission."""
+
+    def __init__(self, urls):
+        self.endpoints = [_Endpoint(u) for u in urls]
+        self._lock = threading.Lock()
+        self._prober = None
+
+    def acquire(self, exclude=(), prefer=None):
+        """Pick an endpoint for a request and count it as outstanding.
+
+        `prefer` (a URL) wins over balancing while that endpoint is healthy
+        and not excluded.
+        """
+        with self._lock:
+            candidates = [e for e in self.endpoints if not e.ejected and e not in exclude]
+            if not candidates:
+                candidates = [e for e in self.endpoints if not e.ejected] or self.endpoints
+            preferred = [e for e in candidates if e.url == prefer]
+            best = preferred[0] if preferred else min(
+                candidates, key=lambda e: (e.outstanding, e.ewma_latency, _retry_rng.random()))
+            best.outstanding += 1
+            best.requests += 1
+            return best
+
+    def release(self, endpoint, latency, ok):
+        """Record the outcome of a request sent to `endpoint`."""
+        eject = False
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.latencies.append(latency)
+                if endpoint.ewma_latency:
+                    endpoint.ewma_latency = 0.8 * endpoint.ewma_latency + 0.2 * latency
+                else:
+                    endpoint.ewma_latency = latency
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            healthy = [e for e in self.endpoints if not e.ejected]
+            # Never eject the last healthy endpoint; the circuit breaker covers that case
+            if (not endpoint.ejected and endpoint.consecutive_failures >= _eject_after
+                    and len(healthy) > 1):
+                endpoint.ejected = True
+                eject = True
+        if eject:
+            print(f"[llm_helper] Ejected Ollama endpoint {endpoint.url} after "
+                  f"{endpoint.consecutive_failures} consecutive failures")
+            _count("endpoint_ejections")
+            self._start_prober()
+
+    def abandon(self, endpoint):
+        """Stop counting a cancelled or cut-short request as outstanding, without judging the endpoint."""
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def _start_prober(self):
+        with self._lock:
+            if self._prober is not None and self._prober.is_alive():
+                return
+            self._prober = threading.Thread(target=self._probe_loop, daemon=True,
+                                            name="llm_helper-health")
+            self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(_health_interval)
+            with self._lock:
+                ejected = [e for e in self.endpoints if e.ejected]
+            if not ejected:
+                return
+            for endpoint in ejected:
+                try:
+                    _http_request("GET", f"{endpoint.url}/api/version", timeout=5)
+                except (urllib.error.URLError, TimeoutError, ConnectionError, OSError,
+                        http.client.HTTPException):
+                    continue
+                with self._lock:
+                    endpoint.ejected = False
+                    endpoint.consecutive_failures = 0
+                print(f"[llm_helper] Re-admitted Ollama endpoint {endpoint.url}")
+                _count("endpoint_readmissions")
+
+
+def _parse_endpoints(urls):
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    return [u.strip() for u in urls if u.strip()]
+
+
+# OLLAMA_URL may list several comma-separated servers
+_ollama_endpoints = _EndpointPool(
+    _parse_endpoints(os.environ.get("OLLAMA_URL", "http://localhost:11434")))
+
+
+def configure_ollama_endpoints(urls):
+    """Use one or more Ollama servers (a list or a comma-separated string)."""
+    global _ollama_endpoints
+    _ollama_endpoints = _EndpointPool(_parse_endpoints(urls))
+
+
+def get_endpoint_stats():
+    """Return per-endpoint health, load, request/failure counts and latency stats."""
+    with _ollama_endpoints._lock:
+        return [e.stats() for e in _ollama_endpoints.endpoints]
+
+
+def _ollama_send(path, payload, timeout, tried=None, cancel=None, prefer=None):
+    """POST to one balanced Ollama endpoint and record the outcome.
+
+    `tried` collects the endpoints used by earlier attempts (and hedges) of the
+    same call, so a retry goes to a different server when there is one. The
+    URL of the endpoint that answered is stored in the body as "_endpoint".
+    """
+    pool = _ollama_endpoints
+    endpoint = pool.acquire(tried or (), prefer)
+    if tried is not None:
+        tried.append(endpoint)
+    start = time.monotonic()
+    ok = False
+    cut_short = False
+    try:
+        body = _post_json(f"{endpoint.url}{path}", payload, timeout=timeout, cancel=cancel)
+        body["_endpoint"] = endpoint.url
+        ok = True
+        return body
+    except (socket.timeout, TimeoutError):
+        cut_short = timeout < _request_timeout
+        raise
+    finally:
+        if not ok and (cut_short or (cancel is not None and cancel.cancelled)):
+            pool.abandon(endpoint)
+        else:
+            pool.release(endpoint, time.monotonic() - start, ok)
+
+
+# ── Request hedging ──────────────────────────────────────────────────────────
+#
+# Optional tail-latency hedging: when an attempt has not answered within the
+# backend's rolling p95 latency, a duplicate is sent (to another Ollama server
+# when there is one, or another slot of the same server / API), the first
+# answer wins and the other request is cancelled. Hedges are capped at
+# `_hedge_max_rate` of all attempts so a uniformly slow backend never sees
+# double the load.
+
+_hedge_enabled = os.environ.get("LLM_HEDGE", "0") not in ("", "0", "false", "no")
+_hedge_quantile = float(os.environ.get("LLM_HEDGE_QUANTILE", "0.95"))
+_hedge_max_rate = float(os.environ.get("LLM_HEDGE_MAX_RATE", "0.1"))
+# Latency samples needed before the quantile is trusted
+_HEDGE_MIN_SAMPLES = 20
+
+
+class _LatencyTracker:
+    """Rolling window of one backend's attempt latencies, and its hedge budget."""
+
+    def __init__(self):
+        self.latencies = collections.deque(maxlen=200)
+        self.attempts = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging this attempt, or None to not hedge it."""
+        with self._lock:
+            self.attempts += 1
+            if (len(self.latencies) < _HEDGE_MIN_SAMPLES
+                    or self.hedges >= _hedge_max_rate * self.attempts):
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(_hedge_quantile * len(ordered)))]
+
+    def take_hedge(self):
+        """Spend one hedge from the budget; False if another call used it up first."""
+        with self._lock:
+            if self.hedges >= _hedge_max_rate * self.attempts:
+                return False
+            self.hedges += 1
+            return True
+
+
+_latency_trackers = collections.defaultdict(_LatencyTracker)
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def configure_hedging(enabled=None, quantile=None, max_rate=None):
+    """Turn request hedging on or off and set its latency quantile and budget (None keeps a setting)."""
+    global _hedge_enabled, _hedge_quantile, _hedge_max_rate
+    if enabled is not None:
+        _hedge_enabled = bool(enabled)
+    if quantile is not None:
+        _hedge_quantile = min(0.999, max(0.5, float(quantile)))
+    if max_rate is not None:
+        _hedge_max_rate = max(0.0, float(max_rate))
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=64,
+                                                 thread_name_prefix="llm_helper-hedge")
+        return _hedge_executor
+
+
+def _hedged(name, send, timeout):
+    """Run send(timeout, cancel) for backend `name`, hedging it if it runs slow.
+
+    Returns the first successful result. If both requests fail, the primary's
+    error is raised so the retry policy sees it as one failed attempt.
+    """
+    tracker = _latency_trackers[name]
+    delay = tracker.hedge_delay() if _hedge_enabled else None
+    start = time.monotonic()
+    if delay is None or delay >= timeout:
+        result = send(timeout, None)
+        tracker.record(time.monotonic() - start)
+        return result
+
+    executor = _get_hedge_executor()
+    cancels = {}
+
+    def submit(budget):
+        cancel = _Cancellation()
+        future = executor.submit(send, budget, cancel)
+        cancels[future] = (cancel, time.monotonic())
+        return future
+
+    primary = submit(timeout)
+    done, _ = wait([primary], timeout=delay)
+    if done or not tracker.take_hedge():
+        result = primary.result()
+        tracker.record(time.monotonic() - start)
+        return result
+
+    _count("hedges_fired")
+    hedge = submit(timeout - delay)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                continue
+            for loser in pending:
+                cancels[loser][0].cancel()
+            if future is hedge:
+                _count("hedge_wins")
+            tracker.record(time.monotonic() - cancels[future][1])
+            return future.result()
+    raise primary.exception()
+
+
+# ── Call telemetry ───────────────────────────────────────────────────────────
+#
+# Every LLM call is recorded with its tags (call type, tick, agents), wall
+# time, token counts and, for Ollama, the server's own load / prompt-eval /
+# eval timings: one JSON line per call in the run's llm_calls.jsonl, plus
+# per-call-type totals (see get_call_stats).
+
+_telemetry_enabled = os.environ.get("LLM_TELEMETRY", "1") not in ("", "0", "false", "no")
+_telemetry_lock = threading.Lock()
+_telemetry_start = time.monotonic()
+_call_stats = collections.defaultdict(collections.Counter)
+
+# Recent prompts, to measure how much of each new prompt a prefix cache could
+# already hold: Ollama reuses the slot with the longest matching prompt, vLLM
+# and Claude any cached prefix, so the longest match among recent prompts is
+# a fair estimate for all of them.
+_PREFIX_WINDOW = 64
+_recent_prompts = collections.deque(maxlen=_PREFIX_WINDOW)
+
+
+def _common_prefix_length(a, b):
+    """Length of the common prefix of two strings (binary search over slices)."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _prefix_tags(tags, prompt, prefix=None):
+    """Add the prompt's estimated tokens, and those shared with a recent prompt, to tags."""
+    if not _telemetry_enabled:
+        return tags
+    text = _SYSTEM_PROMPT + "".join(prefix or []) + prompt
+    with _telemetry_lock:
+        recent = list(_recent_prompts)
+        _recent_prompts.append(text)
+    shared = max((_common_prefix_length(text, other) for other in recent), default=0)
+    return dict(tags or {}, prompt_tokens_est=_estimate_tokens(text),
+                shared_prefix_tokens=shared // 4)
+
+
+def _ollama_telemetry(body):
+    """Token counts and server-side timings (in seconds) of an Ollama response."""
+    return {
+        "input_tokens": body.get("prompt_eval_count", 0),
+        "output_tokens": body.get("eval_count", 0),
+        "load_s": body.get("load_duration", 0) / 1e9,
+        "prompt_eval_s": body.get("prompt_eval_duration", 0) / 1e9,
+        "eval_s": body.get("eval_duration", 0) / 1e9,
+        "server_s": body.get("total_duration", 0) / 1e9,
+    }
+
+
+def _log_call(tags, backend, start, fields=None, ok=True):
+    """Record one LLM call that started at `start` (time.monotonic())."""
+    wall = time.monotonic() - start
+    tags = tags or {}
+    fields = {k: v for k, v in (fields or {}).items() if k != "calls"}
+    record = dict(tags, backend=backend, ok=ok, wall_s=round(wall, 4))
+    record.update((k, round(v, 4) if isinstance(v, float) else v) for k, v in fields.items())
+    record["t"] = round(time.monotonic() - _telemetry_start, 3)
+    with _telemetry_lock:
+        stats = _call_stats[tags.get("call", "other")]
+        stats["calls"] += 1
+        stats["failed"] += not ok
+        stats["wall_s"] += wall
+        for key in ("input_tokens", "output_tokens", "cache_read_tokens", "load_s",
+                    "prompt_eval_s", "eval_s"):
+            stats[key] += fields.get(key, 0)
+        for key in ("prompt_tokens_est", "shared_prefix_tokens"):
+            stats[key] += tags.get(key, 0)
+        if _telemetry_enabled and CALLS_LOG_PATH:
+            with open(CALLS_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def get_call_stats():
+    """Return per-call-type totals since setup (calls, failed, wall_s, tokens, Ollama timings).
+
+    Call types are "rationale", "turn1" ... "turn4", "dialogue" and "scoring"
+    (and "other" for untagged calls); mean_wall_s is the average wall time per
+    call, and shared_prefix_share the share of prompt tokens that repeated the
+    start of a recent prompt.
+    """
+    with _telemetry_lock:
+        stats = {call: dict(counts) for call, counts in _call_stats.items()}
+    for counts in stats.values():
+        counts["mean_wall_s"] = counts["wall_s"] / counts["calls"] if counts["calls"] else 0.0
+        prompt_tokens = counts.get("prompt_tokens_est", 0)
+        counts["shared_prefix_share"] = (counts.get("shared_prefix_tokens", 0) / prompt_tokens
+                                         if prompt_tokens else 0.0)
+    return stats
+
+
+# ── LLM API ──────────────────────────────────────────────────────────────────
+
+def call_llm(prompt, model=None, num_predict=300, prefix=None, usage=None, use_cache=True,
+             deadline=None, tags=None):
+    """Route to the active backend (Ollama, Claude or an OpenAI-compatible server).
+
+    prefix: optional list of stable text blocks that precede `prompt`, most
+            widely shared first (e.g. topic, then persona). Ollama and OpenAI
+            servers receive them concatenated; Claude marks each one as a
+            cacheable prompt prefix.
+    usage:  optional collections.Counter that receives this call's token counts.
+    use_cache: look the prompt up in the response cache (when enabled). With
+            False a fresh response is generated, and still stored.
+    deadline: optional time.monotonic() value by which the call must finish;
+            past it, "" is returned (without a request once it has passed).
+    tags:   optional dict recorded with the call's telemetry, e.g.
+            {"call": "turn1", "tick": 3, "agent": 0, "partner": 5}.
+
+    The "claude-batch" backend answers single prompts through the interactive
+    Messages API; only bulk work (see call_claude_batch) goes through batches.
+    """
     if model is None:
         model = _model
-    payload = json.dumps({
+    tags = _prefix_tags(tags, prompt, prefix)
+    key = None
+    if _response_cache is not None:
+        key = _cache_key(model, "".join(prefix or []) + prompt, num_predict)
+        if use_cache:
+            start = time.monotonic()
+            cached = _response_cache.get(key)
+            if cached is not None:
+                _log_call(tags, _backend, start, {"cached": True})
+                return cached
+    if _backend in ("claude", "claude-batch"):
+        response = call_claude(prompt, model=model, max_tokens=num_predict,
+                               prefix=prefix, usage=usage, deadline=deadline, tags=tags)
+    elif _backend == "openai":
+        response = call_openai(prompt, model=model, max_tokens=num_predict,
+                               prefix=prefix, usage=usage, deadline=deadline, tags=tags)
+    else:
+        response = call_ollama(prompt, model=model, num_predict=num_predict,
+                               prefix=prefix, usage=usage, deadline=deadline, tags=tags)
+    if key is not None and response:
+        _response_cache.put(key, response)
+    return response
+
+
+def _ollama_payload(prompt, model, num_predict, prefix=None):
+    """Build the /api/generate request body."""
+    if prefix:
+        prompt = "".join(prefix) + prompt
+    payload = {
         "model": model,
         "prompt": prompt,
         "system": _SYSTEM_PROMPT,
         "stream": False,
+        "keep_alive": _keep_alive,
         "options": {
-            "temperature": 0.8,
+            "temperature": _temperature,
             "num_predict": num_predict,
         }
-    }).encode("utf-8")
+    }
+    if _seed is not None:
+        payload["options"]["seed"] = _seed
+    return payload
 
-    req = urllib.request.Request(
-        f"{_ollama_url}/api/generate",
-        data=payload,
-        headers={"Content-Type": "application/json"},
+
+def _claude_payload(prompt, model, max_tokens, prefix=None):
+    """Build the /v1/messages request body.
+
+    The system prompt and each prefix block carry a cache_control breakpoint
+    (at most four are allowed per request), so Claude can serve them from its
+    prompt cache. Prefixes shorter than the model's minimum cacheable length
+    (1024-4096 tokens depending on the model) are simply not cached.
+    """
+    content = prompt
+    if prefix:
+        content = [{"type": "text", "text": block, "cache_control": {"type": "ephemeral"}}
+                   for block in prefix[:3] if block]
+        content.append({"type": "text", "text": "".join(prefix[3:]) + prompt})
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": [{"type": "text", "text": _SYSTEM_PROMPT,
+                    "cache_control": {"type": "ephemeral"}}],
+        "messages": [{"role": "user", "content": content}],
+        "temperature": _temperature,
+    }
+
+
+def _openai_payload(prompt, model, max_tokens, prefix=None):
+    """Build the /chat/completions request body.
+
+    The prefix goes first in the user message, so servers with automatic prefix
+    caching (vLLM, llama.cpp) can reuse its KV cache across calls.
+    """
+    if prefix:
+        prompt = "".join(prefix) + prompt
+    payload = {
+        "model": model,
+        "messages": [{"role": "system", "content": _SYSTEM_PROMPT},
+                     {"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": _temperature,
+        "stream": False,
+    }
+    if _seed is not None:
+        payload["seed"] = _seed
+    return payload
+
+
+def _record_usage(counts, usage=None):
+    """Add one call's token counts to the run totals and the caller's counter."""
+    counts = {k: v for k, v in counts.items() if v}
+    with _usage_lock:
+        _usage_totals.update(counts)
+        _usage_totals["calls"] += 1
+    if usage is not None:
+        usage.update(counts)
+        usage["calls"] += 1
+
+
+def _claude_usage(body):
+    """Token counts from a Messages API response's `usage` block."""
+    usage = body.get("usage") or {}
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "cache_write_tokens": usage.get("cache_creation_input_tokens") or 0,
+        "cache_read_tokens": usage.get("cache_read_input_tokens") or 0,
+    }
+
+
+def _openai_usage(body):
+    """Token counts from a chat completion's `usage` block."""
+    usage = body.get("usage") or {}
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return {
+        "input_tokens": (usage.get("prompt_tokens") or 0) - cached,
+        "output_tokens": usage.get("completion_tokens") or 0,
+        "cache_read_tokens": cached,
+    }
+
+
+def get_usage_stats():
+    """Return token usage summed over every LLM call since setup.
+
+    Keys: calls, input_tokens (uncached prompt tokens), output_tokens,
+    cache_write_tokens, cache_read_tokens, and cache_hit_rate — the share of
+    Claude prompt tokens served from the prompt cache.
+    """
+    with _usage_lock:
+        stats = dict(_usage_totals)
+    prompt_tokens = (stats.get("input_tokens", 0) + stats.get("cache_write_tokens", 0)
+                     + stats.get("cache_read_tokens", 0))
+    stats["cache_hit_rate"] = (stats.get("cache_read_tokens", 0) / prompt_tokens
+                               if prompt_tokens else 0.0)
+    return stats
+
+
+def _claude_headers():
+    return {
+        "x-api-key": _claude_api_key,
+        "anthropic-version": "2023-06-01",
+    }
+
+
+def _claude_text(body):
+    """Return the text of the first content block of a Messages API response."""
+    content = body.get("content", [])
+    if content and content[0].get("type") == "text":
+        return content[0]["text"].strip()
+    return ""
+
+
+def _openai_headers():
+    headers = {"Content-Type": "application/json"}
+    if _openai_api_key:
+        headers["Authorization"] = f"Bearer {_openai_api_key}"
+    return headers
+
+
+def _openai_text(body):
+    """Return the message text of the first choice of a chat completion."""
+    choices = body.get("choices") or []
+    if choices:
+        return ((choices[0].get("message") or {}).get("content") or "").strip()
+    return ""
+
+
+def _ollama_generate(payload, deadline=None, prefer=None):
+    """POST a request body to /api/generate; return the decoded response or None.
+
+    The first attempt goes to the `prefer` endpoint (a URL) if it is healthy.
+    """
+    tried = []
+    return _with_retries(
+        "ollama", "Ollama",
+        lambda timeout: _hedged(
+            "ollama",
+            lambda t, cancel: _ollama_send("/api/generate", payload, t, tried, cancel, prefer),
+            timeout),
+        deadline,
     )
-    for attempt in range(3):
+
+
+def _claude_messages(payload, deadline=None):
+    """POST a request body to the Messages API; return the decoded response or None."""
+    limiter = _claude_limiter
+    estimated_input, estimated_output = _claude_payload_tokens(payload)
+
+    def send(timeout, cancel):
+        # The pacing wait comes out of this attempt's time, so it cannot overrun the deadline
+        waited = limiter.acquire(estimated_input, estimated_output, max_wait=timeout)
+        actual_input = actual_output = 0
         try:
-            with urllib.request.urlopen(req, timeout=120) as resp:
-                body = json.loads(resp.read().decode("utf-8"))
-                return body.get("response", "").strip()
-        except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError) as e:
-            print(f"[llm_helper] Ollama error (attempt {attempt+1}/3): {e}")
-        except (ConnectionError, OSError) as e:
-            print(f"[llm_helper] Ollama connection error (attempt {attempt+1}/3): {e}")
-        if attempt < 2:
-            import time
-            time.sleep(2 ** attempt)
-    print("[llm_helper] Ollama failed after 3 attempts")
-    return ""
+            body = _post_json(f"{_claude_url}/v1/messages", payload, headers=_claude_headers(),
+                              timeout=max(0.001, timeout - waited), cancel=cancel)
+            counts = _claude_usage(body)
+            # Cache reads do not count towards the input-tokens-per-minute limit
+            actual_input = counts["input_tokens"] + counts["cache_write_tokens"]
+            actual_output = counts["output_tokens"]
+            return body
+        finally:
+            # Failed and cancelled requests give their token reservation back
+            limiter.reconcile(estimated_input, estimated_output, actual_input, actual_output)
+
+    return _with_retries("claude", "Claude API",
+                         lambda timeout: _hedged("claude", send, timeout), deadline)
+
+
+def _openai_chat(payload, deadline=None):
+    """POST a request body to /chat/completions; return the decoded response or None."""
+    return _with_retries(
+        "openai", "OpenAI API",
+        lambda timeout: _hedged(
+            "openai",
+            lambda t, cancel: _post_json(f"{_openai_url}/chat/completions", payload,
+                                         headers=_openai_headers(), timeout=t, cancel=cancel),
+            timeout),
+        deadline,
+    )
+
+
+def _record_ollama_timing(body):
+    """Split an Ollama response's server time into model loading and generation."""
+    load = body.get("load_duration", 0) / 1e9
+    generate = (body.get("prompt_eval_duration", 0) + body.get("eval_duration", 0)) / 1e9
+    _count("ollama_load_seconds", load)
+    _count("ollama_generate_seconds", generate)
+    # A model that was already resident loads in milliseconds
+    if load > 1.0:
+        _count("ollama_cold_loads")
+
+
+def call_ollama(prompt, model=None, num_predict=300, prefix=None, usage=None, deadline=None,
+                tags=None):
+    """Send a prompt to the Ollama /api/generate endpoint and return the response text."""
+    if model is None:
+        model = _model
+    start = time.monotonic()
+    body = _ollama_generate(_ollama_payload(prompt, model, num_predict, prefix), deadline)
+    if body is None:
+        _log_call(tags, "ollama", start, ok=False)
+        return ""
+    _log_call(tags, "ollama", start, _ollama_telemetry(body))
+    _record_ollama_timing(body)
+    _record_usage({"input_tokens": body.get("prompt_eval_count", 0),
+                   "output_tokens": body.get("eval_count", 0)}, usage)
+    return body.get("response", "").strip()
+
 
+class _OllamaContext(list):
+    """An Ollama context token list that remembers which server produced it."""
 
-def call_claude(prompt, model=None, max_tokens=300):
+    def __init__(self, tokens, endpoint=None):
+        super().__init__(tokens)
+        self.endpoint = endpoint
+
+
+def call_ollama_context(prompt, context=None, model=None, num_predict=300, usage=None,
+                        deadline=None, tags=None):
+    """Like call_ollama, but continue from (and return) Ollama's KV-cache context.
+
+    `context` is the token list returned by a previous call; passing it back lets
+    Ollama resume from the already-evaluated prefix, so `prompt` only needs the
+    new text. Returns (text, context, prompt_eval_count); context is None on failure.
+    The call goes to the server that returned `context`, which is the one holding
+    its KV cache, unless that server is unhealthy.
+    """
+    if model is None:
+        model = _model
+    payload = _ollama_payload(prompt, model, num_predict)
+    if context:
+        payload["context"] = list(context)
+    start = time.monotonic()
+    body = _ollama_generate(payload, deadline, getattr(context, "endpoint", None))
+    if body is None:
+        _log_call(tags, "ollama", start, ok=False)
+        return "", None, 0
+    _log_call(tags, "ollama", start, dict(_ollama_telemetry(body),
+                                          context_tokens=len(context or [])))
+    _record_ollama_timing(body)
+    _record_usage({"input_tokens": body.get("prompt_eval_count", 0),
+                   "output_tokens": body.get("eval_count", 0)}, usage)
+    new_context = body.get("context")
+    if new_context is not None:
+        new_context = _OllamaContext(new_context, body.get("_endpoint"))
+    return body.get("response", "").strip(), new_context, body.get("prompt_eval_count", 0)
+
+
+def call_claude(prompt, model=None, max_tokens=300, prefix=None, usage=None, deadline=None,
+                tags=None):
     """Send a prompt to the Anthropic Messages API and return the response text."""
     if model is None:
         model = _model
     if not _claude_api_key:
         print("[llm_helper] Claude API key not set — check .env file")
         return ""
+    start = time.monotonic()
+    body = _claude_messages(_claude_payload(prompt, model, max_tokens, prefix), deadline)
+    if body is None:
+        _log_call(tags, "claude", start, ok=False)
+        return ""
+    _log_call(tags, "claude", start, _claude_usage(body))
+    _record_usage(_claude_usage(body), usage)
+    return _claude_text(body)
 
-    payload = json.dumps({
-        "model": model,
-        "max_tokens": max_tokens,
-        "system": _SYSTEM_PROMPT,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.8,
-    }).encode("utf-8")
-
-    req = urllib.request.Request(
-        "https://api.anthropic.com/v1/messages",
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "x-api-key": _claude_api_key,
-            "anthropic-version": "2023-06-01",
-        },
+
+def call_openai(prompt, model=None, max_tokens=300, prefix=None, usage=None, deadline=None,
+                tags=None):
+    """Send a prompt to an OpenAI-compatible /chat/completions endpoint and return the text."""
+    if model is None:
+        model = _model
+    start = time.monotonic()
+    body = _openai_chat(_openai_payload(prompt, model, max_tokens, prefix), deadline)
+    if body is None:
+        _log_call(tags, "openai", start, ok=False)
+        return ""
+    _log_call(tags, "openai", start, _openai_usage(body))
+    _record_usage(_openai_usage(body), usage)
+    return _openai_text(body)
+
+
+# ── Message Batches ──────────────────────────────────────────────────────────
+#
+# The Message Batches API trades latency for throughput and cost: requests are
+# queued, processed asynchronously (usually within the hour, at most 24 h) and
+# billed at a discount. Used for bulk work that does not need a reply per tick:
+# setup-time rationale generation and re-scoring of recorded conversations.
+
+_BATCH_MAX_REQUESTS = 10000
+
+
+def _submit_claude_batch(payloads):
+    """Submit Messages API payloads as one batch; return the batch id or None."""
+    requests = [{"custom_id": f"req-{i}", "params": payload}
+                for i, payload in enumerate(payloads)]
+    batch = _with_retries(
+        "claude", "Claude batch submission",
+        lambda timeout: _post_json(f"{_claude_url}/v1/messages/batches",
+                                   {"requests": requests},
+                                   headers=_claude_headers(), timeout=timeout),
     )
-    for attempt in range(3):
+    if batch is None:
+        return None
+    print(f"[llm_helper] Submitted batch {batch['id']} ({len(payloads)} requests)")
+    return batch["id"]
+
+
+def _collect_claude_batch(batch_id, count):
+    """Poll a batch until it ends; return its response texts in submission order.
+
+    Requests that errored, expired or were canceled come back as "".
+    """
+    texts = [""] * count
+    deadline = time.monotonic() + _batch_timeout
+    url = f"{_claude_url}/v1/messages/batches/{batch_id}"
+    while True:
+        batch = _with_retries(
+            "claude", "Claude batch polling",
+            lambda timeout: _get_json(url, headers=_claude_headers(), timeout=timeout),
+        )
+        if batch is None:
+            return texts
+        if batch.get("processing_status") == "ended":
+            break
+        if time.monotonic() >= deadline:
+            print(f"[llm_helper] Batch {batch_id} still running after {_batch_timeout:.0f}s — giving up")
+            return texts
+        time.sleep(_batch_poll_interval)
+    data = _with_retries(
+        "claude", "Claude batch results",
+        lambda timeout: _http_request("GET", batch["results_url"],
+                                      headers=_claude_headers(), timeout=timeout)[2],
+    )
+    if data is None:
+        return texts
+
+    failed = 0
+    for line in data.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
         try:
-            with urllib.request.urlopen(req, timeout=120) as resp:
-                body = json.loads(resp.read().decode("utf-8"))
-                content = body.get("content", [])
-                if content and content[0].get("type") == "text":
-                    return content[0]["text"].strip()
-                return ""
-        except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError) as e:
-            print(f"[llm_helper] Claude API error (attempt {attempt+1}/3): {e}")
-            if hasattr(e, "read"):
-                print(f"[llm_helper] Response: {e.read().decode('utf-8', errors='replace')[:500]}")
-        except (ConnectionError, OSError) as e:
-            print(f"[llm_helper] Claude connection error (attempt {attempt+1}/3): {e}")
-        if attempt < 2:
-            import time
-            time.sleep(2 ** attempt)
-    print("[llm_helper] Claude API failed after 3 attempts")
-    return ""
+            record = json.loads(line)
+            index = int(record["custom_id"].rsplit("-", 1)[1])
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"[llm_helper] Batch {batch_id}: skipping malformed result line ({e})")
+            continue
+        if not 0 <= index < count:
+            continue
+        result = record.get("result") or {}
+        if result.get("type") == "succeeded":
+            texts[index] = _claude_text(result["message"])
+        else:
+            failed += 1
+    if failed:
+        print(f"[llm_helper] Batch {batch_id}: {failed}/{count} requests did not succeed")
+    return texts
+
+
+def call_claude_batch(prompts, model=None, max_tokens=300):
+    """Answer many prompts through the Message Batches API.
+
+    Blocks until every batch has ended and returns the response texts in the
+    same order as `prompts` ("" for requests that failed).
+    """
+    if model is None:
+        model = _model
+    if not _claude_api_key:
+        print("[llm_helper] Claude API key not set — check .env file")
+        return [""] * len(prompts)
+    texts = [None] * len(prompts)
+    keys = [None] * len(prompts)
+    if _response_cache is not None:
+        for i, prompt in enumerate(prompts):
+            keys[i] = _cache_key(model, prompt, max_tokens)
+            texts[i] = _response_cache.get(keys[i])
+    pending = [i for i, text in enumerate(texts) if text is None]
+    for start in range(0, len(pending), _BATCH_MAX_REQUESTS):
+        chunk = pending[start:start + _BATCH_MAX_REQUESTS]
+        batch_id = _submit_claude_batch(
+            [_claude_payload(prompts[i], model, max_tokens) for i in chunk])
+        if batch_id is None:
+            results = [""] * len(chunk)
+        else:
+            results = _collect_claude_batch(batch_id, len(chunk))
+        for i, text in zip(chunk, results):
+            texts[i] = text
+            if keys[i] is not None and text:
+                _response_cache.put(keys[i], text)
+    return texts
+
+
+class _StreamError(Exception):
+    """An error the server reported in the middle of a streamed response."""
+
+
+def _ollama_stream(payload, usage=None, timeout=None):
+    """Yield response fragments from a streaming /api/generate request."""
+    payload = dict(payload, stream=True)
+    pool = _ollama_endpoints
+    endpoint = pool.acquire()
+    start = time.monotonic()
+    ok = False
+    lines = _http_stream_lines("POST", f"{endpoint.url}/api/generate",
+                               json.dumps(payload).encode("utf-8"),
+                               {"Content-Type": "application/json"},
+                               timeout=timeout or _request_timeout)
+    try:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            chunk = json.loads(line.decode("utf-8"))
+            if chunk.get("error"):
+                raise _StreamError(chunk["error"])
+            if chunk.get("response"):
+                ok = True
+                yield chunk["response"]
+            if chunk.get("done"):
+                _record_ollama_timing(chunk)
+                _record_usage({"input_tokens": chunk.get("prompt_eval_count", 0),
+                               "output_tokens": chunk.get("eval_count", 0)}, usage)
+        ok = True
+    finally:
+        lines.close()
+        pool.release(endpoint, time.monotonic() - start, ok)
+
+
+def _claude_stream(payload, usage=None, timeout=None):
+    """Yield text deltas from a streaming (server-sent events) Messages API request."""
+    payload = dict(payload, stream=True)
+    headers = {"Content-Type": "application/json"}
+    headers.update(_claude_headers())
+    lines = _http_stream_lines("POST", f"{_claude_url}/v1/messages",
+                               json.dumps(payload).encode("utf-8"), headers,
+                               timeout=timeout or _request_timeout)
+    try:
+        for line in lines:
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            event = json.loads(line[len(b"data:"):].decode("utf-8"))
+            if event.get("type") == "error":
+                error = event.get("error") or {}
+                raise _StreamError(f"{error.get('type', 'error')}: {error.get('message', '')}")
+            if event.get("type") == "message_start":
+                _record_usage(_claude_usage(event.get("message", {})), usage)
+            elif event.get("type") == "content_block_delta":
+                delta = event.get("delta", {})
+                if delta.get("type") == "text_delta":
+                    yield delta.get("text", "")
+    finally:
+        lines.close()
+
+
+def _openai_stream(payload, usage=None, timeout=None):
+    """Yield content deltas from a streaming (server-sent events) chat completion."""
+    payload = dict(payload, stream=True, stream_options={"include_usage": True})
+    lines = _http_stream_lines("POST", f"{_openai_url}/chat/completions",
+                               json.dumps(payload).encode("utf-8"), _openai_headers(),
+                               timeout=timeout or _request_timeout)
+    try:
+        for line in lines:
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[len(b"data:"):].strip()
+            if data == b"[DONE]":
+                continue
+            chunk = json.loads(data.decode("utf-8"))
+            if chunk.get("error"):
+                error = chunk["error"]
+                raise _StreamError(error.get("message", error) if isinstance(error, dict)
+                                   else error)
+            if chunk.get("usage"):
+                _record_usage(_openai_usage(chunk), usage)
+            for choice in chunk.get("choices") or []:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    yield text
+    finally:
+        lines.close()
+
+
+def call_llm_stream(prompt, model=None, num_predict=300, usage=None, deadline=None,
+                    tags=None):
+    """Yield response text fragments from the active backend as they are generated.
+
+    Close the generator to stop generation early; the connection is dropped, which
+    makes the server stop generating. A retryable HTTP status is retried under the
+    retry policy (honouring Retry-After; throttling does not trip the circuit
+    breaker) as long as nothing has been yielded yet. Other errors, including
+    errors the server reports inside the stream, end it (and are logged), and so
+    does reaching `deadline` (a time.monotonic() value).
+    """
+    if model is None:
+        model = _model
+    tags = _prefix_tags(tags, prompt)
+    start = time.monotonic()
+    call_usage = collections.Counter()
+    timeout = _request_timeout
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            _count("deadline_exceeded")
+            return
+    if _backend in ("claude", "claude-batch"):
+        if not _claude_api_key:
+            print("[llm_helper] Claude API key not set — check .env file")
+            return
+        breaker = _breaker("claude")
+    else:
+        breaker = _breaker("openai" if _backend == "openai" else "ollama")
+    if not breaker.allow():
+        _count("breaker_rejected")
+        return
+    limiter = None
+    if _backend in ("claude", "claude-batch"):
+        payload = _claude_payload(prompt, model, num_predict)
+        limiter = _claude_limiter
+        estimated_input, estimated_output = _claude_payload_tokens(payload)
+        try:
+            timeout -= limiter.acquire(estimated_input, estimated_output, max_wait=timeout)
+        except _PacingTimeout as e:
+            print(f"[llm_helper] Streaming: {e} — giving up")
+            _count("deadline_exceeded")
+            return
+        open_stream = _claude_stream
+    elif _backend == "openai":
+        payload = _openai_payload(prompt, model, num_predict)
+        open_stream = _openai_stream
+    else:
+        payload = _ollama_payload(prompt, model, num_predict)
+        open_stream = _ollama_stream
+    end = time.monotonic() + timeout
+    delay = _retry_base_delay
+    ok = False
+    answered = False  # the backend responded, which is what the breaker judges
+    try:
+        for attempt in range(1, _retry_max_attempts + 1):
+            stream = open_stream(payload, call_usage, max(0.001, end - time.monotonic()))
+            try:
+                for fragment in stream:
+                    yield fragment
+                    if deadline is not None and time.monotonic() >= deadline:
+                        _count("deadline_exceeded")
+                        break
+                ok = answered = True
+                break
+            except urllib.error.HTTPError as e:
+                # Raised before the first fragment, so the request can be sent again
+                print(f"[llm_helper] Streaming error (attempt {attempt}/{_retry_max_attempts}): {e}")
+                if e.code not in _RETRYABLE_STATUS:
+                    # The backend is up; the request itself is bad
+                    answered = True
+                    break
+                retry_after = None
+                if e.code in _THROTTLE_STATUS or e.code == 503:
+                    retry_after = _retry_after_seconds(e)
+                if e.code in _THROTTLE_STATUS:
+                    _count("throttled")
+                else:
+                    breaker.record_failure()
+                _count("failed_attempts")
+                delay = min(_retry_max_delay, _retry_rng.uniform(_retry_base_delay, delay * 3))
+                wait = delay
+                if retry_after is not None:
+                    wait = retry_after
+                    _count("retry_after_waits")
+                if attempt == _retry_max_attempts or not breaker.allow():
+                    break
+                if time.monotonic() + wait >= end:
+                    _count("deadline_exceeded")
+                    break
+                _count("retries")
+                time.sleep(wait)
+            finally:
+                stream.close()
+    except GeneratorExit:
+        # The consumer stopped reading early; the backend was answering fine
+        ok = answered = True
+        raise
+    except (urllib.error.URLError, TimeoutError, ConnectionError, OSError,
+            http.client.HTTPException, ValueError, _StreamError) as e:
+        print(f"[llm_helper] Streaming error: {e}")
+        breaker.record_failure()
+    finally:
+        if answered:
+            breaker.record_success()
+        if not ok:
+            _count("calls_failed")
+        if limiter is not None:
+            # The final output count is not streamed back, so only the input
+            # estimate is corrected; a request that failed before any usage
+            # arrived gives its whole reservation back
+            if call_usage:
+                limiter.reconcile(estimated_input, estimated_output,
+                                  call_usage["input_tokens"] + call_usage["cache_write_tokens"],
+                                  estimated_output)
+            else:
+                limiter.reconcile(estimated_input, estimated_output, 0, 0)
+        if usage is not None:
+            usage.update(call_usage)
+        _log_call(tags, _backend, start, dict(call_usage, streamed=True), ok=ok)
+
+
+# ── Structured output ────────────────────────────────────────────────────────
+#
+# Calls whose answer is data rather than prose (opinion scoring) can constrain
+# the model to a JSON schema: Ollama's `format`, a forced tool call for Claude,
+# and `response_format` for OpenAI-compatible servers. The reply then parses
+# directly instead of through the regex cascade.
+
+# {"a": <Agent A's updated opinion>, "b": <Agent B's updated opinion>}
+_OPINION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "a": {"type": "number", "minimum": -1.0, "maximum": 1.0},
+        "b": {"type": "number", "minimum": -1.0, "maximum": 1.0},
+    },
+    "required": ["a", "b"],
+    "additionalProperties": False,
+}
+# Output cap for JSON scoring per backend. Ollama's grammar emits the bare
+# {"a": -0.35, "b": 0.7}; Claude's forced tool_use block and OpenAI-compatible
+# servers' structured replies add framing that must not run into max_tokens.
+_JSON_SCORE_TOKENS = {"ollama": 40, "openai": 100, "claude": 100, "claude-batch": 100}
+_JSON_TOOL_NAME = "record_answer"
+
+
+def _decode_json_object(text):
+    """Decode a JSON object from a model reply; None if there is none."""
+    if not text:
+        return None
+    try:
+        value = json.loads(text)
+    except ValueError:
+        # Tolerate prose or code fences around the object
+        match = re.search(r"\{.*\}", text, re.DOTALL)
+        if not match:
+            return None
+        try:
+            value = json.loads(match.group(0))
+        except ValueError:
+            return None
+    return value if isinstance(value, dict) else None
+
+
+def call_llm_json(prompt, schema, model=None, num_predict=100, usage=None, use_cache=True,
+                  deadline=None, tags=None):
+    """Like call_llm, but constrain the reply to the JSON `schema` and decode it.
+
+    Returns the decoded object (a dict), or None if the call failed or the
+    reply was not a JSON object.
+    """
+    if model is None:
+        model = _model
+    tags = _prefix_tags(tags, prompt)
+    key = None
+    if _response_cache is not None:
+        key = _cache_key(model, json.dumps(schema, sort_keys=True) + prompt, num_predict)
+        if use_cache:
+            start = time.monotonic()
+            cached = _response_cache.get(key)
+            if cached is not None:
+                _log_call(tags, _backend, start, {"cached": True})
+                return _decode_json_object(cached)
+    start = time.monotonic()
+    fields = None
+    text = ""
+    if _backend in ("claude", "claude-batch"):
+        if not _claude_api_key:
+            print("[llm_helper] Claude API key not set — check .env file")
+            return None
+        payload = _claude_payload(prompt, model, num_predict)
+        payload["tools"] = [{"name": _JSON_TOOL_NAME,
+                             "description": "Record the answer to the request.",
+                             "input_schema": schema}]
+        payload["tool_choice"] = {"type": "tool", "name": _JSON_TOOL_NAME}
+        body = _claude_messages(payload, deadline)
+        if body is not None:
+            fields = _claude_usage(body)
+            _record_usage(fields, usage)
+            for block in body.get("content", []):
+                if block.get("type") == "tool_use":
+                    text = json.dumps(block.get("input"))
+                    break
+    elif _backend == "openai":
+        payload = _openai_payload(prompt, model, num_predict)
+        payload["response_format"] = {"type": "json_schema",
+                                      "json_schema": {"name": "answer", "schema": schema}}
+        body = _openai_chat(payload, deadline)
+        if body is not None:
+            fields = _openai_usage(body)
+            _record_usage(fields, usage)
+            text = _openai_text(body)
+    else:
+        payload = _ollama_payload(prompt, model, num_predict)
+        payload["format"] = schema
+        body = _ollama_generate(payload, deadline)
+        if body is not None:
+            fields = _ollama_telemetry(body)
+            _record_ollama_timing(body)
+            _record_usage({"input_tokens": body.get("prompt_eval_count", 0),
+                           "output_tokens": body.get("eval_count", 0)}, usage)
+            text = body.get("response", "").strip()
+    _log_call(tags, _backend, start, fields, ok=fields is not None)
+    result = _decode_json_object(text)
+    if key is not None and result is not None:
+        _response_cache.put(key, text)
+    return result
+
+
+# ── Async LLM API ────────────────────────────────────────────────────────────
+#
+# The coroutines below run the blocking, pooled backend calls on a dedicated
+# worker pool. A per-event-loop semaphore caps how many requests are in flight
+# at once (LLM_MAX_CONCURRENCY, defaulting to OLLAMA_NUM_PARALLEL), so callers
+# can gather() many prompts without overrunning the backend's parallel slots.
+
+_executor = None
+_executor_lock = threading.Lock()
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+def configure_concurrency(limit):
+    """Set the maximum number of LLM requests the async client keeps in flight."""
+    global _max_concurrency, _executor
+    _max_concurrency = max(1, int(limit))
+    with _executor_lock:
+        old, _executor = _executor, None
+    if old is not None:
+        old.shutdown(wait=False)
+    _async_semaphores.clear()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_concurrency,
+                                           thread_name_prefix="llm_helper")
+        return _executor
+
+
+def _get_semaphore():
+    loop = asyncio.get_running_loop()
+    sem = _async_semaphores.get(loop)
+    if sem is None:
+        sem = asyncio.Semaphore(_max_concurrency)
+        _async_semaphores[loop] = sem
+    return sem
+
+
+async def _run_bounded(func, *args, **kwargs):
+    """Run a blocking LLM call in the worker pool, holding a concurrency slot."""
+    loop = asyncio.get_running_loop()
+    async with _get_semaphore():
+        return await loop.run_in_executor(_get_executor(),
+                                          functools.partial(func, *args, **kwargs))
+
+
+async def acall_llm(prompt, model=None, num_predict=300, **kwargs):
+    """Async counterpart of call_llm."""
+    return await _run_bounded(call_llm, prompt, model=model, num_predict=num_predict, **kwargs)
+
+
+async def acall_llm_json(prompt, schema, model=None, num_predict=100, **kwargs):
+    """Async counterpart of call_llm_json."""
+    return await _run_bounded(call_llm_json, prompt, schema, model=model,
+                              num_predict=num_predict, **kwargs)
+
+
+async def acall_ollama(prompt, model=None, num_predict=300, **kwargs):
+    """Async counterpart of call_ollama."""
+    return await _run_bounded(call_ollama, prompt, model=model, num_predict=num_predict,
+                              **kwargs)
+
+
+async def acall_claude(prompt, model=None, max_tokens=300, **kwargs):
+    """Async counterpart of call_claude."""
+    return await _run_bounded(call_claude, prompt, model=model, max_tokens=max_tokens,
+                              **kwargs)
+
+
+async def acall_openai(prompt, model=None, max_tokens=300, **kwargs):
+    """Async counterpart of call_openai."""
+    return await _run_bounded(call_openai, prompt, model=model, max_tokens=max_tokens,
+                              **kwargs)
 
 
 # ── Memory management ────────────────────────────────────────────────────────
@@ -155,10 +2066,18 @@ def _memory_path(agent_id):
     return os.path.join(MEMORY_DIR, f"agent_{agent_id}.txt")
 
 
-def get_agent_memory(agent_id, length=None):
-    """Return the last `length` conversation entries from an agent's memory file."""
+def get_agent_memory(agent_id, length=None, max_tokens=None):
+    """Return the last `length` conversation entries from an agent's memory file.
+
+    With a token budget (`max_tokens`, default the configured memory budget),
+    only the newest of those entries that fit in it are returned; if not even
+    the newest fits, its last lines are kept. Dropped entries are counted in
+    get_metrics().
+    """
     if length is None:
         length = _memory_length
+    if max_tokens is None:
+        max_tokens = _memory_tokens
     path = _memory_path(agent_id)
     if not os.path.exists(path):
         return ""
@@ -166,9 +2085,45 @@ def get_agent_memory(agent_id, length=None):
         text = f.read()
     entries = [e.strip() for e in text.split("\n---\n") if e.strip()]
     recent = entries[-length:]
+    if max_tokens:
+        recent = _fit_memory(recent, max_tokens)
     return "\n---\n".join(recent)
 
 
+def _fit_memory(entries, max_tokens):
+    """Keep the newest entries whose estimated tokens fit in `max_tokens`."""
+    kept = []
+    used = 0
+    for entry in reversed(entries):
+        tokens = _estimate_tokens(entry)
+        if used + tokens > max_tokens:
+            break
+        kept.append(entry)
+        used += tokens
+    if not kept and entries:
+        # Nothing fits whole: keep the tail of the newest entry, where its
+        # stance and rationale lines are
+        lines = entries[-1].splitlines()
+        while lines and _estimate_tokens("\n".join(lines)) > max_tokens:
+            lines.pop(0)
+        if lines:
+            kept.append("\n".join(lines))
+            used = _estimate_tokens(kept[0])
+    total = sum(_estimate_tokens(e) for e in entries)
+    if used < total:
+        _count("memory_truncations")
+        _count("memory_entries_dropped", len(entries) - len(kept))
+        _count("memory_tokens_dropped", total - used)
+    _count("memory_tokens_sent", used)
+    return kept[::-1]
+
+
+def configure_memory_budget(max_tokens):
+    """Set the token budget for the memory injected into each prompt (0 = no budget)."""
+    global _memory_tokens
+    _memory_tokens = int(max_tokens)
+
+
 def _append_memory(agent_id, entry):
     """Append a conversation entry to an agent's memory file."""
     path = _memory_path(agent_id)
@@ -222,8 +2177,8 @@ def _is_degenerate_rationale(text):
     return False
 
 
-def _generate_rationale(opinion, topic):
-    """Prompt the LLM to generate a 1-sentence reason for why an agent holds their opinion."""
+def _rationale_prompt(opinion, topic):
+    """Build the prompt asking for a 1-sentence reason behind an opinion."""
     if opinion > 0.3:
         stance_desc = "supports"
     elif opinion < -0.3:
@@ -231,7 +2186,7 @@ def _generate_rationale(opinion, topic):
     else:
         stance_desc = "is conflicted about"
 
-    prompt = (
+    return (
         f"You are creating a fictional character for a research simulation.\n"
         f'The topic is: "{topic}"\n'
         f"This character {stance_desc} this position "
@@ -240,29 +2195,55 @@ def _generate_rationale(opinion, topic):
         f"for their belief. Ground it in a concrete life experience, value, or "
         f"concern. Write only the sentence — no headers, bullets, or markdown."
     )
+
+
+def _fallback_rationale(opinion, topic):
+    """Template rationale used when the LLM only produces degenerate ones."""
+    if opinion > 0.3:
+        return f"Based on personal experience, this position on {topic} seems right."
+    elif opinion < -0.3:
+        return f"Based on personal experience, this position on {topic} seems wrong."
+    else:
+        return f"There are valid points on both sides of {topic}."
+
+
+def _generate_rationale(opinion, topic, agent_id=None):
+    """Prompt the LLM to generate a 1-sentence reason for why an agent holds their opinion."""
+    prompt = _rationale_prompt(opinion, topic)
+    tags = {"call": "rationale", "tick": 0, "agent": agent_id}
     for attempt in range(2):
-        response = call_llm(prompt, num_predict=100)
+        # A retry must not be answered with the same cached degenerate response
+        response = call_llm(prompt, num_predict=100, use_cache=(attempt == 0), tags=tags)
         if response:
             first_line = response.strip().split("\n")[0].strip()
             if not _is_degenerate_rationale(first_line):
                 return first_line
         if attempt == 0:
             print(f"[llm_helper] Degenerate rationale, retrying: {response!r:.80}")
-    # Fallback template
-    if opinion > 0.3:
-        return f"Based on personal experience, this position on {topic} seems right."
-    elif opinion < -0.3:
-        return f"Based on personal experience, this position on {topic} seems wrong."
-    else:
-        return f"There are valid points on both sides of {topic}."
+    return _fallback_rationale(opinion, topic)
+
+
+def _generate_rationales_batch(opinions, topic):
+    """Generate every agent's rationale in one Message Batch.
+
+    Degenerate or failed batch results are regenerated one at a time.
+    """
+    responses = call_claude_batch([_rationale_prompt(o, topic) for o in opinions],
+                                  max_tokens=100)
+    rationales = []
+    for i, (opinion, response) in enumerate(zip(opinions, responses)):
+        first_line = response.strip().split("\n")[0].strip() if response else ""
+        if _is_degenerate_rationale(first_line):
+            first_line = _generate_rationale(opinion, topic, agent_id=i)
+        rationales.append(first_line)
+    return rationales
 
 
 # ── Opinion extraction from response ─────────────────────────────────────────
 
 def _extract_opinion_from_response(response, fallback):
     """Extract an OPINION: <float> line from an LLM response. Returns the float or fallback."""
-    global _parse_attempts, _parse_failures
-    _parse_attempts += 1
+    _count_parse_attempt()
     # Strip markdown bold markers so **OPINION:** **-0.83** still matches
     cleaned = re.sub(r"\*\*", "", response)
     # Try exact OPINION: <float> pattern first
@@ -280,42 +2261,40 @@ def _extract_opinion_from_response(response, fallback):
         except ValueError:
             pass
     # Log parse failure
-    _parse_failures += 1
-    rate = _parse_failures / _parse_attempts * 100
-    print(f"[llm_helper] Parse failure ({_parse_failures}/{_parse_attempts}, {rate:.1f}%) — using fallback {fallback:.2f}")
-    with open(PARSE_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(f"Failure {_parse_failures}/{_parse_attempts} ({rate:.1f}%) | fallback={fallback:.2f} | response={response[:200]!r}\n")
+    _record_parse_failure(None, fallback, response)
     # Fallback: keep previous opinion unchanged (failed turn)
     return fallback
 
 
+def _match_tagged_opinion(tag, cleaned):
+    """Return the float following `TAG:` in cleaned text, or None if there is none."""
+    # Try exact TAG: <float>
+    match = re.search(rf"{tag}:\s*([-+]?\d*\.?\d+)", cleaned)
+    if not match:
+        # Fallback: any float on the same line as the tag
+        match = re.search(rf"{tag}:.*?([-+]?\d*\.?\d+)", cleaned)
+    if match:
+        try:
+            return max(-1.0, min(1.0, float(match.group(1))))
+        except ValueError:
+            pass
+    return None
+
+
 def _extract_paired_opinions(response, fallback_a, fallback_b):
     """Extract OPINION_A and OPINION_B from a symmetric scoring response.
 
     Returns (opinion_a, opinion_b) as floats clamped to [-1, 1].
     Falls back to the provided defaults on parse failure.
     """
-    global _parse_attempts, _parse_failures
     cleaned = re.sub(r"\*\*", "", response)
 
     def _find_opinion(tag, fallback):
-        global _parse_attempts, _parse_failures
-        _parse_attempts += 1
-        # Try exact TAG: <float>
-        match = re.search(rf"{tag}:\s*([-+]?\d*\.?\d+)", cleaned)
-        if not match:
-            # Fallback: any float on the same line as the tag
-            match = re.search(rf"{tag}:.*?([-+]?\d*\.?\d+)", cleaned)
-        if match:
-            try:
-                return max(-1.0, min(1.0, float(match.group(1))))
-            except ValueError:
-                pass
-        _parse_failures += 1
-        rate = _parse_failures / _parse_attempts * 100
-        print(f"[llm_helper] Parse failure for {tag} ({_parse_failures}/{_parse_attempts}, {rate:.1f}%) — using fallback {fallback:.2f}")
-        with open(PARSE_LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(f"Failure {_parse_failures}/{_parse_attempts} ({rate:.1f}%) | tag={tag} | fallback={fallback:.2f} | response={response[:200]!r}\n")
+        _count_parse_attempt()
+        value = _match_tagged_opinion(tag, cleaned)
+        if value is not None:
+            return value
+        _record_parse_failure(tag, fallback, response)
         return fallback
 
     opinion_a = _find_opinion("OPINION_A", fallback_a)
@@ -323,47 +2302,275 @@ def _extract_paired_opinions(response, fallback_a, fallback_b):
     return opinion_a, opinion_b
 
 
+def _extract_json_opinions(scores, fallback_a, fallback_b):
+    """Read opinions from a structured scoring reply ({"a": float, "b": float}).
+
+    `scores` is the decoded object, or None if the call failed. Returns
+    (opinion_a, opinion_b) clamped to [-1, 1], each falling back on its own.
+    """
+    def _find_opinion(tag, key, fallback):
+        _count_parse_attempt()
+        value = (scores or {}).get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return max(-1.0, min(1.0, float(value)))
+        _record_parse_failure(tag, fallback, json.dumps(scores))
+        return fallback
+
+    return (_find_opinion("OPINION_A", "a", fallback_a),
+            _find_opinion("OPINION_B", "b", fallback_b))
+
+
+def _count_parse_attempt():
+    global _parse_attempts
+    with _parse_lock:
+        _parse_attempts += 1
+
+
+def _record_parse_failure(tag, fallback, response):
+    """Count a scoring parse failure and append it to the parse failure log."""
+    global _parse_failures
+    with _parse_lock:
+        _parse_failures += 1
+        rate = _parse_failures / _parse_attempts * 100
+        where = f" for {tag}" if tag else ""
+        print(f"[llm_helper] Parse failure{where} ({_parse_failures}/{_parse_attempts}, {rate:.1f}%) — using fallback {fallback:.2f}")
+        with open(PARSE_LOG_PATH, "a", encoding="utf-8") as f:
+            tag_field = f" | tag={tag}" if tag else ""
+            f.write(f"Failure {_parse_failures}/{_parse_attempts} ({rate:.1f}%){tag_field} | fallback={fallback:.2f} | response={response[:200]!r}\n")
+
+
+def _paired_opinions_ready(partial):
+    """Check whether a partial scoring response already holds both opinion lines.
+
+    Only complete lines are considered, so a number still being streamed
+    ("0." of "0.45") is never taken as final.
+    """
+    complete = re.sub(r"\*\*", "", partial[:partial.rfind("\n") + 1])
+    return (_match_tagged_opinion("OPINION_A", complete) is not None
+            and _match_tagged_opinion("OPINION_B", complete) is not None)
+
+
+def _score_streaming(scoring_prompt, fallback_a, fallback_b, num_predict=50, usage=None,
+                     deadline=None, tags=None):
+    """Stream the scoring response and stop as soon as both opinions are parsed.
+
+    If `deadline` passes before both opinions arrive, the fallbacks are kept
+    without a parse attempt, as when a blocking scoring call is cut off.
+    """
+    key = None
+    if _response_cache is not None:
+        key = _cache_key(_model, scoring_prompt, num_predict)
+        start = time.monotonic()
+        cached = _response_cache.get(key)
+        if cached is not None:
+            _log_call(tags, _backend, start, {"cached": True})
+            return _extract_paired_opinions(cached, fallback_a, fallback_b)
+    response = ""
+    stream = call_llm_stream(scoring_prompt, num_predict=num_predict, usage=usage,
+                             deadline=deadline, tags=tags)
+    try:
+        for fragment in stream:
+            response += fragment
+            if _paired_opinions_ready(response):
+                break
+    finally:
+        stream.close()
+    # A response cut off by the deadline is not worth replaying
+    cut_off = deadline is not None and time.monotonic() >= deadline
+    if response and key is not None and (not cut_off or _paired_opinions_ready(response)):
+        _response_cache.put(key, response)
+    if cut_off and not _paired_opinions_ready(response):
+        return fallback_a, fallback_b
+    if not response:
+        response = call_llm(scoring_prompt, num_predict=num_predict, usage=usage,
+                            deadline=deadline, tags=tags)
+    return _extract_paired_opinions(response, fallback_a, fallback_b)
+
+
 # ── Transcript logging ────────────────────────────────────────────────────────
 
 def _log_transcript(tick, agent_a, agent_b, conversation, opinion_a, opinion_b,
-                    prior_a=None, prior_b=None):
-    """Append a conversation record to the master transcript."""
+                    prior_a=None, prior_b=None, turns_used=None):
+    """Append a conversation record to the master transcript.
+
+    turns_used: optional (turn count, early exit reason or None).
+    """
     with open(TRANSCRIPT_PATH, "a", encoding="utf-8") as f:
         f.write(f"=== Tick {tick} | Agent {agent_a} <-> Agent {agent_b} ===\n")
         if prior_a is not None and prior_b is not None:
             f.write(f"PRIOR_STANCE: A({agent_a})={prior_a:.3f}, B({agent_b})={prior_b:.3f}\n")
+        if turns_used is not None:
+            count, reason = turns_used
+            f.write(f"TURNS_USED: {count}" + (f" ({reason})" if reason else "") + "\n")
         f.write(conversation.rstrip() + "\n")
         f.write(f"Opinions after: A({agent_a})={opinion_a:.3f}, B({agent_b})={opinion_b:.3f}\n")
         f.write("\n")
 
 
+def _log_kv_reuse(tick, agent_a, agent_b, prompt_eval_tokens, reused_tokens):
+    """Append one tick's KV-cache reuse figures to kv_cache.log."""
+    with open(KV_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(f"Tick {tick} | Agent {agent_a} <-> Agent {agent_b} | "
+                f"prompt_eval_tokens={prompt_eval_tokens} | "
+                f"saved_prompt_tokens={reused_tokens}\n")
+
+
+def _log_budget(tick, agent_a, agent_b, budget):
+    """Append a conversation that ran out of its time budget to budget.log."""
+    with open(BUDGET_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(f"Tick {tick} | Agent {agent_a} <-> Agent {agent_b} | "
+                f"elapsed={budget.elapsed():.1f}s | cut_calls={budget.cut} | "
+                f"skipped_calls={budget.skipped}\n")
+
+
+def _log_event(event):
+    """Append an asynchronous activation event to events.jsonl."""
+    if EVENTS_LOG_PATH:
+        with open(EVENTS_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event) + "\n")
+
+
+def _log_prompt_cache(tick, agent_a, agent_b, usage):
+    """Append one tick's Claude prompt-cache token counts to prompt_cache.log."""
+    with open(PROMPT_CACHE_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(f"Tick {tick} | Agent {agent_a} <-> Agent {agent_b} | "
+                f"input_tokens={usage['input_tokens']} | "
+                f"cache_write_tokens={usage['cache_write_tokens']} | "
+                f"cache_read_tokens={usage['cache_read_tokens']}\n")
+
+
+def _warm_up_ollama(model):
+    """Start loading `model` on every Ollama endpoint; return the loader threads.
+
+    An empty generate request makes Ollama load the model and keep it for
+    `_keep_alive`, so the first ticks do not pay the load latency.
+    """
+    def load(endpoint):
+        start = time.monotonic()
+        try:
+            body = _post_json(f"{endpoint.url}/api/generate",
+                              {"model": model, "keep_alive": _keep_alive},
+                              timeout=_request_timeout)
+        except (urllib.error.URLError, TimeoutError, ConnectionError, OSError,
+                http.client.HTTPException, ValueError) as e:
+            print(f"[llm_helper] Warm-up of {model} on {endpoint.url} failed: {e}")
+            return
+        load_seconds = body.get("load_duration", 0) / 1e9
+        _count("warmup_load_seconds", load_seconds)
+        print(f"[llm_helper] Model {model} ready on {endpoint.url} "
+              f"(load {load_seconds:.1f}s, wall {time.monotonic() - start:.1f}s)")
+
+    threads = [threading.Thread(target=load, args=(endpoint,), daemon=True,
+                                name="llm_helper-warmup")
+               for endpoint in _ollama_endpoints.endpoints]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
 # ── Setup ─────────────────────────────────────────────────────────────────────
 
 def setup_agents(num_agents, topic, model_name, memory_length=5, backend="ollama",
-                  claude_model="claude-haiku-4-5-20251001"):
+                  claude_model="claude-haiku-4-5-20251001", kv_reuse=False,
+                  scoring_mode="text", seed=None, temperature=0.8, response_cache=None,
+                  keep_alive=None, conversation_budget=None, openai_model=None,
+                  memory_tokens=None, dialogue_mode="turns", early_exit=False):
     """
     Initialize agent memory files and set random initial stances.
     Returns a list of initial opinion scores (floats in [-1, 1]).
-    backend: "ollama" or "claude"
-    claude_model: model ID to use when backend is "claude"
+    backend: "ollama", "claude", "claude-batch" (Claude, with setup-time
+             rationales generated through the Message Batches API) or "openai"
+             (an OpenAI-compatible server at OPENAI_BASE_URL)
+    claude_model: model ID to use when backend is "claude" or "claude-batch"
+    openai_model: model name to use when backend is "openai" (None uses model_name)
+    kv_reuse: carry Ollama's KV-cache context between each agent's turns
+              (Ollama backend only); saved prompt tokens go to kv_cache.log
+    scoring_mode: "text" waits for the full scoring response; "stream" streams
+                  it and stops as soon as OPINION_A and OPINION_B are parsed;
+                  "json" constrains it to a {"a": float, "b": float} object
+    seed: seeds the initial opinions and Ollama's sampling, for replayable runs
+    temperature: sampling temperature for every LLM call
+    response_cache: path of an SQLite response cache to use (True for
+                    llm_cache.sqlite3 next to this file); None leaves it as is
+    keep_alive: how long Ollama keeps the model loaded between requests
+                (e.g. "30m", or -1 to pin it); None keeps OLLAMA_KEEP_ALIVE
+    conversation_budget: seconds each run_conversation may spend on LLM calls
+                (0 = unlimited); None keeps LLM_CONVERSATION_BUDGET
+    memory_tokens: token budget for the memory in each prompt; the newest
+                   entries that fit are kept (0 = only memory_length applies);
+                   None keeps LLM_MEMORY_TOKENS
+    dialogue_mode: "turns" makes one call per conversation turn; "compact" has
+                   one call write all four turns, then scores them separately;
+                   "combined" also scores them in that same call. Replies
+                   that do not hold four alternating turns fall back to "turns"
+    early_exit: end a turn-by-turn conversation after turn 2 or 3 when the
+                agents already agree, a turn concedes, or a speaker repeats
+                themselves; the turns used are recorded in the transcript
     """
     global _topic, _model, _memory_length, _num_agents, _parse_attempts, _parse_failures
-    global _backend, _claude_api_key
-    global MEMORY_DIR, TRANSCRIPT_PATH, PARSE_LOG_PATH
+    global _backend, _claude_api_key, _kv_reuse, _scoring_mode, _seed, _temperature
+    global _keep_alive, _conversation_budget, _openai_api_key, _memory_tokens, _dialogue_mode
+    global _early_exit
+    global MEMORY_DIR, TRANSCRIPT_PATH, PARSE_LOG_PATH, KV_LOG_PATH, PROMPT_CACHE_LOG_PATH
+    global BUDGET_LOG_PATH, CALLS_LOG_PATH, EVENTS_LOG_PATH, _activation_clock
+    # Conversations still in the pipeline belong to the previous run
+    finish_conversations()
     _topic = topic
     _model = model_name
     _memory_length = memory_length
     _num_agents = num_agents
     _backend = backend.lower()
-
-    if _backend == "claude":
+    _kv_reuse = bool(kv_reuse)
+    _scoring_mode = scoring_mode.lower()
+    _dialogue_mode = dialogue_mode.lower()
+    _early_exit = bool(early_exit)
+    _seed = seed
+    _temperature = temperature
+    if seed is not None:
+        random.seed(seed)
+    if response_cache:
+        if response_cache is True:
+            response_cache = os.path.join(SCRIPT_DIR, "llm_cache.sqlite3")
+        configure_response_cache(response_cache)
+    if keep_alive is not None:
+        _keep_alive = keep_alive
+    if conversation_budget is not None:
+        _conversation_budget = float(conversation_budget)
+    if memory_tokens is not None:
+        _memory_tokens = int(memory_tokens)
+
+    # Reset parse failure counters, usage totals and metrics
+    _parse_attempts = 0
+    _parse_failures = 0
+    with _usage_lock:
+        _usage_totals.clear()
+    with _metrics_lock:
+        _metrics.clear()
+    with _telemetry_lock:
+        _call_stats.clear()
+
+    # Load the model in the background while the run directory is set up
+    warmup_threads = []
+    if _backend == "ollama":
+        warmup_threads = _warm_up_ollama(_model)
+
+    if _backend in ("claude", "claude-batch"):
         env_vars = _load_env()
         _claude_api_key = env_vars.get("ANTHROPIC_API_KEY", "")
         if not _claude_api_key:
             print("[llm_helper] WARNING: ANTHROPIC_API_KEY not found in .env file")
         _model = claude_model
         print(f"[llm_helper] Using Claude model: {_model}")
-        print(f"[llm_helper] Backend: Claude API")
+        if _backend == "claude-batch":
+            print(f"[llm_helper] Backend: Claude API (Message Batches for setup)")
+        else:
+            print(f"[llm_helper] Backend: Claude API")
+    elif _backend == "openai":
+        _openai_api_key = _load_env().get("OPENAI_API_KEY", _openai_api_key)
+        if openai_model:
+            _model = openai_model
+        print(f"[llm_helper] Backend: OpenAI-compatible server at {_openai_url} "
+              f"(model: {_model})")
 
     # Create run-specific output directory
     from datetime import datetime
@@ -372,28 +2579,45 @@ def setup_agents(num_agents, topic, model_name, memory_length=5, backend="ollama
     MEMORY_DIR = os.path.join(run_dir, "agent_memories")
     TRANSCRIPT_PATH = os.path.join(run_dir, "transcript.txt")
     PARSE_LOG_PATH = os.path.join(run_dir, "parse_failures.log")
+    KV_LOG_PATH = os.path.join(run_dir, "kv_cache.log")
+    PROMPT_CACHE_LOG_PATH = os.path.join(run_dir, "prompt_cache.log")
+    BUDGET_LOG_PATH = os.path.join(run_dir, "budget.log")
+    CALLS_LOG_PATH = os.path.join(run_dir, "llm_calls.jsonl")
+    EVENTS_LOG_PATH = os.path.join(run_dir, "events.jsonl")
+    _activation_clock = 0
     print(f"[llm_helper] Run directory: {run_dir}")
 
     # Create memory directory
     os.makedirs(MEMORY_DIR, exist_ok=True)
 
-    # Reset parse failure counters
-    _parse_attempts = 0
-    _parse_failures = 0
-
     # Initialize transcript and parse failure log
     with open(TRANSCRIPT_PATH, "w", encoding="utf-8") as f:
         f.write(f"# Transcript: {topic}\n# Model: {_model}\n# Backend: {_backend}\n\n")
     with open(PARSE_LOG_PATH, "w", encoding="utf-8") as f:
         f.write(f"# Parse failures: {topic} | {_model}\n")
+    if _kv_reuse and _backend == "ollama":
+        with open(KV_LOG_PATH, "w", encoding="utf-8") as f:
+            f.write(f"# KV-cache reuse: {topic} | {_model}\n")
+    if _backend in ("claude", "claude-batch"):
+        with open(PROMPT_CACHE_LOG_PATH, "w", encoding="utf-8") as f:
+            f.write(f"# Prompt cache usage: {topic} | {_model}\n")
+    if _conversation_budget:
+        with open(BUDGET_LOG_PATH, "w", encoding="utf-8") as f:
+            f.write(f"# Conversations over their {_conversation_budget:g}s budget: "
+                    f"{topic} | {_model}\n")
 
     # Generate random initial stances and opinions
-    initial_opinions = []
+    initial_opinions = [random.uniform(-1.0, 1.0) for _ in range(num_agents)]
+
+    for thread in warmup_threads:
+        thread.join()
 
-    for i in range(num_agents):
-        opinion = random.uniform(-1.0, 1.0)
-        initial_opinions.append(opinion)
+    # Generate rationales via LLM, all in one batch for the batch backend
+    rationales = None
+    if _backend == "claude-batch":
+        rationales = _generate_rationales_batch(initial_opinions, topic)
 
+    for i, opinion in enumerate(initial_opinions):
         # Map opinion to a stance description
         if opinion > 0.6:
             stance = f"Strongly in favor of the position on {topic}"
@@ -406,8 +2630,10 @@ def setup_agents(num_agents, topic, model_name, memory_length=5, backend="ollama
         else:
             stance = f"Strongly against the position on {topic}"
 
-        # Generate a rationale via LLM
-        rationale = _generate_rationale(opinion, topic)
+        if rationales is not None:
+            rationale = rationales[i]
+        else:
+            rationale = _generate_rationale(opinion, topic, agent_id=i)
 
         # Write initial memory with stance and rationale
         with open(_memory_path(i), "w", encoding="utf-8") as f:
@@ -419,16 +2645,385 @@ def setup_agents(num_agents, topic, model_name, memory_length=5, backend="ollama
     return initial_opinions
 
 
+# ── Prompt layout ─────────────────────────────────────────────────────────────
+#
+# Conversation prompts are assembled from layers ordered from most to least
+# widely shared: the system prompt (every call; each backend sends it first),
+# the topic (every call), the persona (all of one agent's calls, with its
+# rarely changing rationale before its per-tick score), the memory, and last
+# the current turn. Everything before the turn is passed as call_llm's
+# prefix, so Ollama's slot cache, vLLM's prefix cache and Claude's cache
+# breakpoints can reuse the longest possible run of already-seen prompt. The
+# shared part of every call is reported in llm_calls.jsonl.
+
+def _topic_block(topic=None):
+    return f'Topic: "{_topic if topic is None else topic}"\n'
+
+
+def _persona_block(stance, opinion, rationale):
+    return (f"Your character's reasoning: {rationale}\n"
+            f"Your character believes: {stance} (score: {opinion:.2f})\n")
+
+
+def _memory_block(memory):
+    return f"\nYour recent conversation history:\n{memory}\n" if memory else ""
+
+
+def _prompt_layers(topic, persona="", memory=""):
+    """Return call_llm's prefix: the topic, persona and memory layers, in that order."""
+    return [layer for layer in (topic, persona, memory) if layer]
+
+
 # ── Conversation ──────────────────────────────────────────────────────────────
 
+# Share of a conversation budget held back for its last call, the scoring pass
+_SCORING_RESERVE = 0.2
+
+
+class _ConversationBudget:
+    """Caps the total time of one conversation's LLM calls.
+
+    Each call may use whatever is left, except that calls before the last one
+    (the scoring pass) stop short of a small reserve kept for it. A slow call
+    is thus only cut once the conversation as a whole runs out of time. Once
+    its share is spent the deadline handed out is already past and the call
+    returns "" at once.
+    """
+
+    def __init__(self, seconds, calls):
+        self.start = time.monotonic()
+        self.end = self.start + seconds if seconds > 0 else None
+        self.reserve = seconds * _SCORING_RESERVE
+        self.calls_left = calls
+        self.cut = 0        # calls that ran into their deadline
+        self.skipped = 0    # calls not sent because nothing was left
+        self._deadline = None
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def exhausted(self):
+        return self.end is not None and time.monotonic() >= self.end
+
+    def _settle(self):
+        # A call that returned only at its deadline was cut short
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            self.cut += 1
+        self._deadline = None
+
+    def next_deadline(self):
+        """Deadline (time.monotonic()) for the next call, or None without a budget."""
+        if self.end is None:
+            return None
+        self._settle()
+        end = self.end if self.calls_left <= 1 else self.end - self.reserve
+        self.calls_left -= 1
+        now = time.monotonic()
+        if now >= end:
+            self.skipped += 1
+            return now
+        self._deadline = end
+        return self._deadline
+
+    def add_calls(self, n):
+        """Expect `n` more (or, if negative, fewer) calls before the scoring pass."""
+        self.calls_left += n
+
+    def skip(self):
+        """Record a call left out because the budget is spent."""
+        self._settle()
+        self.skipped += 1
+
+    def finish(self):
+        """Settle the last call; return True if the budget cut or skipped any call."""
+        if self.end is None:
+            return False
+        self._settle()
+        return bool(self.cut or self.skipped)
+
+
 def run_conversation(agent_a_id, agent_b_id, tick, memory_length=None):
     """
     Run a 4-turn conversation between two agents (A-B-A-B) with symmetric scoring.
-    Uses 5 LLM calls: 4 conversation turns + 1 scoring pass.
-    Returns a dict: {"opinion_a": float, "opinion_b": float, "snippet": str}
+    Uses 5 LLM calls: 4 conversation turns + 1 scoring pass. With a
+    conversation budget (see setup_agents) the calls share that much time, and
+    any call the budget cuts off falls back to its default text or opinions.
+    Returns a dict: {"opinion_a": float, "opinion_b": float, "snippet": str,
+    "agent_a": id, "agent_b": id, "tick": tick}
     """
     if memory_length is None:
         memory_length = _memory_length
+    return _record_conversation(_converse(agent_a_id, agent_b_id, tick, memory_length))
+
+
+def run_conversations(pairs, tick, memory_length=None, max_workers=None):
+    """
+    Run conversations between disjoint pairs of agents concurrently.
+
+    pairs: a matching such as [(0, 7), (3, 12)]; no agent may be in two pairs.
+    The conversations run on up to `max_workers` threads (default
+    LLM_MAX_CONCURRENCY). Memories, the transcript and the per-conversation
+    logs are written once all have finished, in the order of `pairs`. A
+    conversation that fails is logged and recorded with both agents keeping
+    their opinions, so it does not lose the rest of the batch.
+    Returns a list of run_conversation results in the order of `pairs`.
+    """
+    if memory_length is None:
+        memory_length = _memory_length
+    pairs = [tuple(pair) for pair in pairs]
+    seen = set()
+    for agent_a_id, agent_b_id in pairs:
+        for agent_id in (agent_a_id, agent_b_id):
+            if agent_id in seen:
+                raise ValueError(f"agent {agent_id} is in more than one pair")
+            seen.add(agent_id)
+    workers = min(len(pairs), max_workers or _max_concurrency)
+    if workers <= 1:
+        conversations = [_converse_or_fallback(a, b, tick, memory_length) for a, b in pairs]
+    else:
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix="llm_conversation") as pool:
+            futures = [pool.submit(_converse_or_fallback, a, b, tick, memory_length)
+                       for a, b in pairs]
+            conversations = [future.result() for future in futures]
+    return [_record_conversation(conversation) for conversation in conversations]
+
+
+class ConversationPipeline:
+    """Overlaps conversations whose agents are not already in flight.
+
+    A submitted conversation starts at once unless one of its agents is in a
+    conversation that has not been recorded yet; then that conversation, and
+    every one submitted before it, is recorded first. Conversations are
+    recorded in submission order, so memories and the transcript come out as
+    in a sequential run. At most `depth` conversations are in flight. A
+    conversation that fails is logged and recorded with both agents keeping
+    their opinions, so the error never surfaces in submit or collect.
+    """
+
+    def __init__(self, depth=None):
+        self.depth = max(1, depth or _pipeline_depth)
+        self._pool = ThreadPoolExecutor(max_workers=self.depth,
+                                        thread_name_prefix="llm_pipeline")
+        self._pending = collections.deque()  # (agents, future) in submission order
+        self._results = []
+
+    def submit(self, agent_a_id, agent_b_id, tick, memory_length=None):
+        """Start a conversation once its agents and a pipeline slot are free."""
+        if agent_a_id == agent_b_id:
+            raise ValueError(f"agent {agent_a_id} cannot talk to itself")
+        if memory_length is None:
+            memory_length = _memory_length
+        agents = {agent_a_id, agent_b_id}
+        while any(agents & busy for busy, _ in self._pending):
+            _count("pipeline_conflict_waits")
+            self._record_next()
+        while len(self._pending) >= self.depth:
+            self._record_next()
+        future = self._pool.submit(_converse_or_fallback, agent_a_id, agent_b_id, tick,
+                                   memory_length)
+        self._pending.append((agents, future))
+
+    def collect(self, wait=False):
+        """Record the finished conversations at the head of the pipeline.
+
+        With `wait`, record every submitted conversation. Returns the results
+        recorded since the last collect, in submission order.
+        """
+        while self._pending and (wait or self._pending[0][1].done()):
+            self._record_next()
+        results, self._results = self._results, []
+        return results
+
+    def _record_next(self):
+        _, future = self._pending.popleft()
+        self._results.append(_record_conversation(future.result()))
+
+    def close(self):
+        """Record everything still in flight and stop the worker threads."""
+        results = self.collect(wait=True)
+        self._pool.shutdown()
+        return results
+
+
+_pipeline = None
+
+
+def pipeline_conversations(pairs, tick, memory_length=None):
+    """Submit this tick's conversations to the shared ConversationPipeline.
+
+    Returns the results (as from run_conversation) of the conversations that
+    have been recorded since the last call, in tick order; each names its
+    agents and tick. finish_conversations() returns the rest.
+    """
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = ConversationPipeline()
+    for agent_a_id, agent_b_id in pairs:
+        _pipeline.submit(agent_a_id, agent_b_id, tick, memory_length)
+    return _pipeline.collect()
+
+
+def finish_conversations():
+    """Wait for every pipelined conversation; return the results not yet collected."""
+    global _pipeline
+    if _pipeline is None:
+        return []
+    pipeline, _pipeline = _pipeline, None
+    return pipeline.close()
+
+
+# Interaction network pairs are drawn from (see setup_network); None = fully mixed
+_network = None
+_network_rng = random.Random()
+
+
+def setup_network(topology, degree=4, seed=None):
+    """Build the interaction network network_pairs draws conversation pairs from.
+
+    topology: "lattice", "small-world", "scale-free", the path of an edge-list
+    file (see interaction_network.py), or None for a fully mixed population.
+    The network covers the agents of the last setup_agents call; `seed`
+    defaults to its seed.
+    """
+    global _network, _network_rng
+    if seed is None:
+        seed = _seed
+    _network_rng = random.Random(seed)
+    if topology is None:
+        _network = None
+        return None
+    import interaction_network
+    _network = interaction_network.build_network(topology, _num_agents, degree, seed)
+    print(f"[llm_helper] Interaction network: {topology}, {_network.num_edges} edges")
+    return _network
+
+
+def network_pairs(size=None):
+    """Return up to `size` disjoint pairs of neighbouring agents, for run_conversations.
+
+    Without a network (see setup_network), pairs any agents at random.
+    """
+    if _network is None:
+        ids = _network_rng.sample(range(_num_agents), 2 * min(size or _num_agents,
+                                                              _num_agents // 2))
+        return [[ids[i], ids[i + 1]] for i in range(0, len(ids), 2)]
+    return [[u, v] for u, v in _network.matching(size, _network_rng)]
+
+
+# Logical clock of asynchronous activation: conversations started since setup,
+# and their transcript tick unless activation_events is given one
+_activation_clock = 0
+
+
+def _idle_pair(idle, rng):
+    """Pick two idle agents to talk, or None if no two may.
+
+    Any two agents may talk in a fully mixed population; with an interaction
+    network (see setup_network), only neighbours.
+    """
+    if _network is None:
+        return tuple(rng.sample(idle, 2)) if len(idle) >= 2 else None
+    idle_set = set(idle)
+    order = list(idle)
+    rng.shuffle(order)
+    for agent_a_id in order:
+        partners = [b for b in _network.neighbors_of(agent_a_id) if b in idle_set]
+        if partners:
+            return agent_a_id, rng.choice(partners)
+    return None
+
+
+def activation_events(num_conversations, max_in_flight=None, agent_ids=None,
+                      memory_length=None, seed=None, tick=None):
+    """
+    Run conversations with asynchronous activation, yielding an event for each.
+
+    Instead of a global barrier per tick, two idle agents are paired at random
+    as soon as a slot is free (neighbours only, with an interaction network),
+    with at most `max_in_flight` conversations running (default
+    LLM_MAX_CONCURRENCY), until `num_conversations` have been started or no
+    idle agents may pair. `agent_ids` defaults to all agents. Conversations
+    still in the pipeline (see pipeline_conversations) are recorded first.
+
+    Each conversation is recorded as soon as it finishes, and its event is the
+    run_conversation result plus logical and wall-clock timestamps: "started"
+    (its start order since setup), "event" (its finish order), and
+    "started_s"/"finished_s" (seconds since the call). Its "tick", also used
+    in the transcript, is `tick` when given (e.g. NetLogo's tick counter) and
+    otherwise the start order, which counts separately from other ticks.
+    Events are also appended to events.jsonl.
+    """
+    global _activation_clock
+    finish_conversations()
+    if agent_ids is None:
+        agent_ids = range(_num_agents)
+    if memory_length is None:
+        memory_length = _memory_length
+    idle = sorted(agent_ids)
+    workers = min(max_in_flight or _max_concurrency, len(idle) // 2)
+    if workers < 1:
+        raise ValueError("asynchronous activation needs at least two agents")
+    rng = random.Random(seed)
+    start = time.monotonic()
+    running = {}  # future -> (start order, seconds since the call)
+    started = finished = 0
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm_activation")
+    try:
+        while started < num_conversations or running:
+            while started < num_conversations and len(running) < workers:
+                pair = _idle_pair(idle, rng)
+                if pair is None:
+                    break
+                agent_a_id, agent_b_id = pair
+                idle.remove(agent_a_id)
+                idle.remove(agent_b_id)
+                order = _activation_clock
+                _activation_clock += 1
+                future = pool.submit(_converse_or_fallback, agent_a_id, agent_b_id,
+                                     order if tick is None else tick, memory_length)
+                running[future] = (order, time.monotonic() - start)
+                started += 1
+            if not running:
+                print(f"[llm_helper] No idle agents are neighbours — asynchronous activation "
+                      f"stopped after {started} of {num_conversations} conversations")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            # Conversations that finished together are recorded in start order
+            for future in sorted(done, key=running.get):
+                order, started_s = running.pop(future)
+                result = _record_conversation(future.result())
+                idle.extend((result["agent_a"], result["agent_b"]))
+                idle.sort()
+                finished += 1
+                event = dict(result, started=order, event=finished,
+                             started_s=round(started_s, 3),
+                             finished_s=round(time.monotonic() - start, 3))
+                _log_event(event)
+                yield event
+    finally:
+        # Still record conversations left running if the caller stops early
+        for future in sorted(running, key=running.get):
+            try:
+                _record_conversation(future.result())
+            except Exception as e:
+                print(f"[llm_helper] Conversation failed after activation stopped: {e}")
+        pool.shutdown()
+
+
+def run_activation(num_conversations, max_in_flight=None, agent_ids=None,
+                   memory_length=None, seed=None, tick=None):
+    """Run activation_events to the end and return its events as a list."""
+    return list(activation_events(num_conversations, max_in_flight, agent_ids,
+                                  memory_length, seed, tick))
+
+
+def _converse(agent_a_id, agent_b_id, tick, memory_length):
+    """Make a conversation's LLM calls; return what _record_conversation writes.
+
+    Only reads the two agents' memories, so conversations between disjoint
+    pairs can run at the same time.
+    """
 
     stance_a = _get_current_stance(agent_a_id)
     stance_b = _get_current_stance(agent_b_id)
@@ -449,117 +3044,291 @@ def run_conversation(agent_a_id, agent_b_id, tick, memory_length=None):
             "Play devil's advocate to explore weaknesses in their argument."
         )
 
-    # Build memory context strings
-    memory_context_a = ""
-    if memory_a:
-        memory_context_a = f"\nYour recent conversation history:\n{memory_a}\n"
-    memory_context_b = ""
-    if memory_b:
-        memory_context_b = f"\nYour recent conversation history:\n{memory_b}\n"
-
     # Build devil's advocate block for prompt injection
     da_block = f"{devil_advocate}\n\n" if devil_advocate else ""
 
-    # ── Turn 1: Agent A opens ──
-    turn1_prompt = (
-        f'Topic: "{_topic}"\n'
-        f"Your character believes: {stance_a} (score: {opinion_a_current:.2f})\n"
-        f"Your character's reasoning: {rationale_a}\n"
-        f"{memory_context_a}"
-        f"{da_block}"
-        f"Speaking as your character, state your position on this topic and give "
-        f"ONE specific argument supporting it. Be direct — no hedging or seeking "
-        f"common ground. Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
-    )
-    turn_1 = call_llm(turn1_prompt)
-    if not turn_1:
-        turn_1 = f"I believe {stance_a}."
-
-    # ── Turn 2: Agent B responds ──
-    turn2_prompt = (
-        f'Topic: "{_topic}"\n'
-        f"Your character believes: {stance_b} (score: {opinion_b_current:.2f})\n"
-        f"Your character's reasoning: {rationale_b}\n"
-        f"{memory_context_b}"
-        f"{da_block}"
-        f'Another character said: "{turn_1}"\n\n'
-        f"Speaking as your character, respond to their argument. Defend your "
-        f"character's position with a specific counterpoint or evidence. "
-        f"Do not simply agree. "
-        f"Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
-    )
-    turn_2 = call_llm(turn2_prompt)
-    if not turn_2:
-        turn_2 = f"I disagree. {stance_b}."
-
-    # ── Turn 3: Agent A replies ──
-    turn3_prompt = (
-        f'Topic: "{_topic}"\n'
-        f"Your character believes: {stance_a} (score: {opinion_a_current:.2f})\n"
-        f"Your character's reasoning: {rationale_a}\n"
-        f"{da_block}"
-        f"Conversation so far:\n"
-        f'Your character said: "{turn_1}"\n'
-        f'The other character replied: "{turn_2}"\n\n'
-        f"Speaking as your character, respond to their points. Your character may "
-        f"shift their view if the other made a compelling argument, or push back "
-        f"if they disagree. Be specific. "
-        f"Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
-    )
-    turn_3 = call_llm(turn3_prompt)
-    if not turn_3:
-        turn_3 = "That's an interesting point, but I maintain my view."
-
-    # ── Turn 4: Agent B responds to A's rebuttal ──
-    turn4_prompt = (
-        f'Topic: "{_topic}"\n'
-        f"Your character believes: {stance_b} (score: {opinion_b_current:.2f})\n"
-        f"Your character's reasoning: {rationale_b}\n"
-        f"{da_block}"
-        f"Conversation so far:\n"
-        f'Agent A said: "{turn_1}"\n'
-        f'Your character replied: "{turn_2}"\n'
-        f'Agent A responded: "{turn_3}"\n\n'
-        f"Speaking as your character, respond to their latest points. Your character may "
-        f"shift their view if the other made a compelling argument, or push back "
-        f"if they disagree. Be specific. "
-        f"Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
-    )
-    turn_4 = call_llm(turn4_prompt)
-    if not turn_4:
-        turn_4 = "I've considered your points but stand by my position."
+    # Prompt layers, most widely shared first (see "Prompt layout")
+    topic_block = _topic_block()
+    persona_a = _persona_block(stance_a, opinion_a_current, rationale_a)
+    persona_b = _persona_block(stance_b, opinion_b_current, rationale_b)
+    prefix_a = _prompt_layers(topic_block, persona_a, _memory_block(memory_a))
+    prefix_b = _prompt_layers(topic_block, persona_b, _memory_block(memory_b))
+    # Turns 3 and 4 quote the conversation so far instead of the memory
+    short_prefix_a = _prompt_layers(topic_block, persona_a)
+    short_prefix_b = _prompt_layers(topic_block, persona_b)
+    usage = collections.Counter()
+    budget = _ConversationBudget(_conversation_budget,
+                                 _DIALOGUE_CALLS.get(_dialogue_mode, 5))
+
+    def tags(call, speaker, listener):
+        return {"call": call, "tick": tick, "agent": speaker, "partner": listener}
+
+    turns = combined_opinions = exit_reason = None
+    turn_3 = turn_4 = None
+    if _dialogue_mode in ("compact", "combined"):
+        # One call writes the whole A-B-A-B exchange from both personas (and,
+        # combined, the updated opinions); a reply that is not four
+        # alternating turns falls back to the turn-by-turn protocol below.
+        combined = _dialogue_mode == "combined"
+        dialogue_prefix, dialogue_prompt = _dialogue_prompt(
+            topic_block,
+            (stance_a, opinion_a_current, rationale_a, memory_a),
+            (stance_b, opinion_b_current, rationale_b, memory_b),
+            da_block, combined)
+        response = call_llm(dialogue_prompt, num_predict=_DIALOGUE_TOKENS, prefix=dialogue_prefix,
+                            usage=usage, deadline=budget.next_deadline(),
+                            tags=tags("dialogue", agent_a_id, agent_b_id))
+        turns = _parse_dialogue(response)
+        if turns is None:
+            _count("dialogue_fallbacks")
+            budget.add_calls(4)
+        elif combined:
+            combined_opinions = _combined_opinions(response)
+            if combined_opinions is None:
+                _count("combined_scoring_fallbacks")
+                budget.add_calls(1)
+    # With KV reuse, each agent's turns form one Ollama context chain: turn 3
+    # continues from turn 1's context and turn 4 from turn 2's, so only the
+    # other agent's latest reply has to be evaluated.
+    use_kv = _kv_reuse and _backend == "ollama" and turns is None
+    context_a = context_b = None
+    reused_tokens = 0
+
+    if turns is not None:
+        turn_1, turn_2, turn_3, turn_4 = turns
+    else:
+        # ── Turn 1: Agent A opens ──
+        turn1_prompt = (
+            f"{da_block}"
+            f"Speaking as your character, state your position on this topic and give "
+            f"ONE specific argument supporting it. Be direct — no hedging or seeking "
+            f"common ground. Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
+        )
+        if use_kv:
+            turn_1, context_a, _ = call_ollama_context("".join(prefix_a) + turn1_prompt,
+                                                       usage=usage,
+                                                       deadline=budget.next_deadline(),
+                                                       tags=tags("turn1", agent_a_id, agent_b_id))
+        else:
+            turn_1 = call_llm(turn1_prompt, prefix=prefix_a, usage=usage,
+                              deadline=budget.next_deadline(),
+                              tags=tags("turn1", agent_a_id, agent_b_id))
+        if not turn_1:
+            turn_1 = f"I believe {stance_a}."
+
+        # ── Turn 2: Agent B responds ──
+        turn2_prompt = (
+            f"{da_block}"
+            f'Another character said: "{turn_1}"\n\n'
+            f"Speaking as your character, respond to their argument. Defend your "
+            f"character's position with a specific counterpoint or evidence. "
+            f"Do not simply agree. "
+            f"Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
+        )
+        if use_kv:
+            turn_2, context_b, _ = call_ollama_context("".join(prefix_b) + turn2_prompt,
+                                                       usage=usage,
+                                                       deadline=budget.next_deadline(),
+                                                       tags=tags("turn2", agent_b_id, agent_a_id))
+        else:
+            turn_2 = call_llm(turn2_prompt, prefix=prefix_b, usage=usage,
+                              deadline=budget.next_deadline(),
+                              tags=tags("turn2", agent_b_id, agent_a_id))
+        if not turn_2:
+            turn_2 = f"I disagree. {stance_b}."
+
+        # With early exit, stop once more turns would add little
+        exit_reason = _early_exit_reason([turn_1, turn_2])
+        if exit_reason is None:
+            # ── Turn 3: Agent A replies ──
+            turn3_prompt = (
+                f"{da_block}"
+                f"Conversation so far:\n"
+                f'Your character said: "{turn_1}"\n'
+                f'The other character replied: "{turn_2}"\n\n'
+                f"Speaking as your character, respond to their points. Your character may "
+                f"shift their view if the other made a compelling argument, or push back "
+                f"if they disagree. Be specific. "
+                f"Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
+            )
+            if use_kv and context_a:
+                continuation = (
+                    f'The other character replied: "{turn_2}"\n\n'
+                    f"Speaking as your character, respond to their points. Your character may "
+                    f"shift their view if the other made a compelling argument, or push back "
+                    f"if they disagree. Be specific. "
+                    f"Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
+                )
+                turn_3, continued, _ = call_ollama_context(
+                    continuation, context=context_a, usage=usage, deadline=budget.next_deadline(),
+                    tags=tags("turn3", agent_a_id, agent_b_id))
+                # Only an answered call actually reused the context
+                if turn_3 or continued is not None:
+                    reused_tokens += len(context_a)
+            else:
+                turn_3 = call_llm(turn3_prompt, prefix=short_prefix_a, usage=usage,
+                                  deadline=budget.next_deadline(),
+                                  tags=tags("turn3", agent_a_id, agent_b_id))
+            if not turn_3:
+                turn_3 = "That's an interesting point, but I maintain my view."
+            exit_reason = _early_exit_reason([turn_1, turn_2, turn_3])
+
+        if exit_reason is None:
+            # ── Turn 4: Agent B responds to A's rebuttal ──
+            turn4_prompt = (
+                f"{da_block}"
+                f"Conversation so far:\n"
+                f'Agent A said: "{turn_1}"\n'
+                f'Your character replied: "{turn_2}"\n'
+                f'Agent A responded: "{turn_3}"\n\n'
+                f"Speaking as your character, respond to their latest points. Your character may "
+                f"shift their view if the other made a compelling argument, or push back "
+                f"if they disagree. Be specific. "
+                f"Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
+            )
+            if use_kv and context_b:
+                continuation = (
+                    f'Agent A responded: "{turn_3}"\n\n'
+                    f"Speaking as your character, respond to their latest points. Your character may "
+                    f"shift their view if the other made a compelling argument, or push back "
+                    f"if they disagree. Be specific. "
+                    f"Keep it to 2-3 sentences MAX. No headers, bullets, or markdown."
+                )
+                turn_4, continued, _ = call_ollama_context(
+                    continuation, context=context_b, usage=usage, deadline=budget.next_deadline(),
+                    tags=tags("turn4", agent_b_id, agent_a_id))
+                # Only an answered call actually reused the context
+                if turn_4 or continued is not None:
+                    reused_tokens += len(context_b)
+            else:
+                turn_4 = call_llm(turn4_prompt, prefix=short_prefix_b, usage=usage,
+                                  deadline=budget.next_deadline(),
+                                  tags=tags("turn4", agent_b_id, agent_a_id))
+            if not turn_4:
+                turn_4 = "I've considered your points but stand by my position."
+        if exit_reason is not None:
+            _count("early_exits")
+            _count(f"early_exit_{exit_reason}")
+            skipped = 4 - len([t for t in (turn_1, turn_2, turn_3, turn_4) if t is not None])
+            _count("turns_skipped", skipped)
+            budget.add_calls(-skipped)
 
     # ── Symmetric scoring pass ──
-    scoring_prompt = (
-        f'Given this conversation about "{_topic}":\n'
-        f"A: {turn_1}\n"
-        f"B: {turn_2}\n"
-        f"A: {turn_3}\n"
-        f"B: {turn_4}\n\n"
-        f"Agent A's prior stance: {stance_a} (score: {opinion_a_current:.2f})\n"
-        f"Agent A's reasoning: {rationale_a}\n\n"
-        f"Agent B's prior stance: {stance_b} (score: {opinion_b_current:.2f})\n"
-        f"Agent B's reasoning: {rationale_b}\n\n"
-        f"Based on the conversation, what is each agent's updated opinion?\n"
-        f"Each agent may shift their view if the other made a compelling argument, or hold firm if unconvinced.\n"
-        f"Score from -1.0 (strongly against) to 1.0 (strongly in favor).\n\n"
-        f"OPINION_A: <float>\n"
-        f"OPINION_B: <float>"
-    )
-    scoring_response = call_llm(scoring_prompt, num_predict=50)
-    opinion_a, opinion_b = _extract_paired_opinions(
-        scoring_response, opinion_a_current, opinion_b_current
+    turns_used = [t for t in (turn_1, turn_2, turn_3, turn_4) if t is not None]
+    conversation = "\n".join(f"{speaker}: {text}" for speaker, text in zip("ABAB", turns_used))
+    scoring_prefix, scoring_turn = _scoring_layers(
+        conversation,
+        stance_a, opinion_a_current, rationale_a,
+        stance_b, opinion_b_current, rationale_b,
+        structured=(_scoring_mode == "json"),
     )
+    scoring_prompt = "".join(scoring_prefix) + scoring_turn
+    if combined_opinions is not None:
+        opinion_a, opinion_b = combined_opinions
+    elif budget.exhausted():
+        # No time left to score: keep both prior opinions
+        budget.skip()
+        opinion_a, opinion_b = opinion_a_current, opinion_b_current
+    elif _scoring_mode == "json":
+        scores = call_llm_json(scoring_prompt, _OPINION_SCHEMA,
+                               num_predict=_JSON_SCORE_TOKENS.get(_backend, 100),
+                               usage=usage, deadline=budget.next_deadline(),
+                               tags=tags("scoring", agent_a_id, agent_b_id))
+        if scores is None and budget.exhausted():
+            opinion_a, opinion_b = opinion_a_current, opinion_b_current
+        else:
+            opinion_a, opinion_b = _extract_json_opinions(
+                scores, opinion_a_current, opinion_b_current
+            )
+    elif _scoring_mode == "stream":
+        opinion_a, opinion_b = _score_streaming(
+            scoring_prompt, opinion_a_current, opinion_b_current, usage=usage,
+            deadline=budget.next_deadline(), tags=tags("scoring", agent_a_id, agent_b_id)
+        )
+    else:
+        scoring_response = call_llm(scoring_turn, num_predict=50, prefix=scoring_prefix,
+                                    usage=usage, deadline=budget.next_deadline(),
+                                    tags=tags("scoring", agent_a_id, agent_b_id))
+        if not scoring_response and budget.exhausted():
+            opinion_a, opinion_b = opinion_a_current, opinion_b_current
+        else:
+            opinion_a, opinion_b = _extract_paired_opinions(
+                scoring_response, opinion_a_current, opinion_b_current
+            )
+    budget_exhausted = budget.finish()
+    if budget_exhausted:
+        _count("budgets_exhausted")
+        _count("budget_cut_calls", budget.cut)
+        _count("budget_skipped_calls", budget.skipped)
+
+    return {
+        "tick": tick, "agent_a": agent_a_id, "agent_b": agent_b_id,
+        "conversation": conversation,
+        "turn_1": turn_1,
+        "turns_used": (len(turns_used), exit_reason) if _early_exit else None,
+        "opinion_a": opinion_a, "opinion_b": opinion_b,
+        "prior_a": opinion_a_current, "prior_b": opinion_b_current,
+        "rationale_a": rationale_a, "rationale_b": rationale_b,
+        "usage": usage, "reused_tokens": reused_tokens if use_kv else None,
+        "budget": budget if budget_exhausted else None,
+    }
+
+
+def _converse_or_fallback(agent_a_id, agent_b_id, tick, memory_length):
+    """Run _converse for one of a batch of conversations, never raising.
+
+    If the conversation fails, the error is logged and a fallback record is
+    returned in which both agents state their stances and keep their opinions,
+    so the conversation is still recorded in its place.
+    """
+    try:
+        return _converse(agent_a_id, agent_b_id, tick, memory_length)
+    except Exception as e:
+        print(f"[llm_helper] Conversation {agent_a_id} <-> {agent_b_id} at tick {tick} "
+              f"failed: {e!r} — agents keep their opinions")
+        _count("conversations_failed")
+    stance_a = _get_current_stance(agent_a_id)
+    stance_b = _get_current_stance(agent_b_id)
+    opinion_a, opinion_b = _extract_number(stance_a), _extract_number(stance_b)
+    turn_1 = f"I believe {stance_a}."
+    return {
+        "tick": tick, "agent_a": agent_a_id, "agent_b": agent_b_id,
+        "conversation": f"A: {turn_1}\nB: I disagree. {stance_b}.",
+        "turn_1": turn_1,
+        "turns_used": None,
+        "opinion_a": opinion_a, "opinion_b": opinion_b,
+        "prior_a": opinion_a, "prior_b": opinion_b,
+        "rationale_a": _get_current_rationale(agent_a_id),
+        "rationale_b": _get_current_rationale(agent_b_id),
+        "usage": collections.Counter(), "reused_tokens": None, "budget": None,
+    }
+
+
+def _record_conversation(c):
+    """Write a finished conversation's logs, memories and transcript entry.
+
+    Returns the run_conversation result for it.
+    """
+    tick, agent_a_id, agent_b_id = c["tick"], c["agent_a"], c["agent_b"]
+    opinion_a, opinion_b = c["opinion_a"], c["opinion_b"]
+    turn_1 = c["turn_1"]
+    usage = c["usage"]
+    if c["reused_tokens"] is not None:
+        _log_kv_reuse(tick, agent_a_id, agent_b_id, usage["input_tokens"], c["reused_tokens"])
+    if c["budget"] is not None:
+        _log_budget(tick, agent_a_id, agent_b_id, c["budget"])
+    if _backend in ("claude", "claude-batch"):
+        _log_prompt_cache(tick, agent_a_id, agent_b_id, usage)
 
     # Build the full conversation text
-    conversation = f"A: {turn_1}\nB: {turn_2}\nA: {turn_3}\nB: {turn_4}"
+    conversation = c["conversation"]
 
     # Build a short snippet for display
     snippet = f"A: {turn_1[:80]}" if turn_1 else "..."
 
     # Carry forward or update rationale
-    rationale_a_updated = rationale_a
-    rationale_b_updated = rationale_b
+    rationale_a_updated = c["rationale_a"]
+    rationale_b_updated = c["rationale_b"]
 
     # Update memories
     entry_a = (
@@ -579,9 +3348,188 @@ def run_conversation(agent_a_id, agent_b_id, tick, memory_length=None):
 
     # Log to transcript
     _log_transcript(tick, agent_a_id, agent_b_id, conversation, opinion_a, opinion_b,
-                    prior_a=opinion_a_current, prior_b=opinion_b_current)
+                    prior_a=c["prior_a"], prior_b=c["prior_b"], turns_used=c["turns_used"])
+
+    return {"opinion_a": opinion_a, "opinion_b": opinion_b, "snippet": snippet,
+            "agent_a": agent_a_id, "agent_b": agent_b_id, "tick": tick}
+
+
+# Calls per conversation in each dialogue mode (before any fallback)
+_DIALOGUE_CALLS = {"turns": 5, "compact": 2, "combined": 1}
+_DIALOGUE_TOKENS = 600  # room for four 2-3 sentence turns and two score lines
+
+
+def _dialogue_prompt(topic_block, character_a, character_b, da_block, combined=False):
+    """Build the (prefix, prompt) for a whole conversation written in one call.
+
+    Each character is (stance, opinion score, rationale, memory). With
+    `combined`, the reply is also asked to end with OPINION_A/OPINION_B lines.
+    """
+    personas = ""
+    memories = ""
+    for name, (stance, opinion, rationale, memory) in (("A", character_a), ("B", character_b)):
+        personas += (f"Character {name}'s reasoning: {rationale}\n"
+                     f"Character {name} believes: {stance} (score: {opinion:.2f})\n")
+        if memory:
+            memories += f"\nCharacter {name}'s recent conversation history:\n{memory}\n"
+    prompt = (
+        f"\n{da_block}"
+        f"Write the conversation between the two characters, four turns in all:\n"
+        f"1. A states their position and gives ONE specific argument supporting it. "
+        f"Direct — no hedging or seeking common ground.\n"
+        f"2. B responds with a specific counterpoint or evidence, and does not simply agree.\n"
+        f"3. A responds to B's points, shifting their view only if B made a compelling "
+        f"argument, otherwise pushing back. Specific.\n"
+        f"4. B responds to A's latest points the same way.\n"
+        f"Each turn is 2-3 sentences MAX in the character's own voice. No headers, bullets, "
+        f"or markdown. Write exactly four lines:\n"
+        f"A: <turn 1>\nB: <turn 2>\nA: <turn 3>\nB: <turn 4>"
+    )
+    if combined:
+        prompt += (
+            "\n\nThen give each character's updated opinion after the conversation, from "
+            "-1.0 (strongly against) to 1.0 (strongly in favor). Each may shift their view "
+            "if the other made a compelling argument, or hold firm if unconvinced:\n"
+            "OPINION_A: <float>\nOPINION_B: <float>"
+        )
+    return _prompt_layers(topic_block, personas, memories), prompt
+
+
+def _parse_dialogue(response):
+    """Split a one-call conversation into its four turns.
+
+    Returns [turn_1, turn_2, turn_3, turn_4], or None unless the response
+    holds exactly four non-empty turns by A, B, A, B.
+    """
+    turns = []
+    for line in response.splitlines():
+        cleaned = re.sub(r"[*_#]", "", line).strip()
+        if cleaned.upper().startswith("OPINION"):
+            break
+        match = re.match(r"^(?:\d+[.)]\s*)?(?:Character |Agent )?([AB])\s*:\s*(.*)$", cleaned)
+        if match:
+            turns.append([match.group(1), match.group(2)])
+        elif turns and cleaned:
+            turns[-1][1] += " " + cleaned
+    if [speaker for speaker, _ in turns] != ["A", "B", "A", "B"]:
+        return None
+    texts = [text.strip().strip('"').strip() for _, text in turns]
+    return texts if all(texts) else None
+
+
+def _combined_opinions(response):
+    """Return (opinion_a, opinion_b) from a combined dialogue, or None if either is missing.
 
-    return {"opinion_a": opinion_a, "opinion_b": opinion_b, "snippet": snippet}
+    Only scores that are used count as parse attempts. A reply missing one is
+    scored by a separate call, which counts its own attempts and failures.
+    """
+    cleaned = re.sub(r"\*\*", "", response)
+    opinion_a = _match_tagged_opinion("OPINION_A", cleaned)
+    opinion_b = _match_tagged_opinion("OPINION_B", cleaned)
+    if opinion_a is None or opinion_b is None:
+        return None
+    _count_parse_attempt()
+    _count_parse_attempt()
+    return opinion_a, opinion_b
+
+
+# Early exit: share of words a turn may have in common with its speaker's previous turn
+_REPEAT_SIMILARITY = 0.6
+_CONCESSION_RE = re.compile(
+    r"\b(?:i (?:completely |fully |now |totally )?agree with you|you(?:'re| are) (?:absolutely |completely )?right"
+    r"|i concede|you(?:'ve| have) (?:convinced|persuaded) me|i(?:'ve| have) changed my mind"
+    r"|i stand corrected)\b",
+    re.IGNORECASE,
+)
+# Softer signals that a speaker shares the other's view
+_AGREEMENT_RE = re.compile(
+    r"\b(?:i agree|we agree|we both (?:agree|want|see)|agreed|common ground|on the same page"
+    r"|see eye to eye|i share your view|that's exactly my point|exactly what i think)\b",
+    re.IGNORECASE,
+)
+_QUALIFIER_RE = re.compile(r"\b(?:but|however|yet|although|though)\b", re.IGNORECASE)
+
+
+def _unqualified(pattern, turn):
+    """True if `pattern` matches a turn with no "but" (or similar) after it."""
+    match = pattern.search(turn)
+    return bool(match) and not _QUALIFIER_RE.search(turn[match.end():])
+
+
+def _concedes(turn):
+    """True if a turn gives in without a "but" after the concession."""
+    return _unqualified(_CONCESSION_RE, turn)
+
+
+def _agrees(turn):
+    """True if a turn states agreement (or concedes) without a "but" after it."""
+    return _unqualified(_AGREEMENT_RE, turn) or _concedes(turn)
+
+
+def _repeats(turn, earlier):
+    """True if a turn mostly reuses the words of the speaker's previous turn."""
+    words = set(re.findall(r"[a-z']+", turn.lower()))
+    earlier_words = set(re.findall(r"[a-z']+", earlier.lower()))
+    if not words or not earlier_words:
+        return False
+    return len(words & earlier_words) / len(words | earlier_words) >= _REPEAT_SIMILARITY
+
+
+def _early_exit_reason(turns):
+    """Return why a conversation can end after `turns` ("agreement",
+    "concession" or "repetition"), or None if it should go on.
+
+    Judged only from what was said: the agents' opinions before the
+    conversation say nothing about whether it has run its course.
+    """
+    if not _early_exit or len(turns) < 2:
+        return None
+    if _agrees(turns[-1]) and _agrees(turns[-2]):
+        return "agreement"
+    if _concedes(turns[-1]):
+        return "concession"
+    if len(turns) >= 3 and _repeats(turns[-1], turns[-3]):
+        return "repetition"
+    return None
+
+
+def _scoring_layers(conversation, stance_a, opinion_a, rationale_a,
+                    stance_b, opinion_b, rationale_b, topic=None, structured=False):
+    """Build the symmetric scoring (prefix, prompt) for a finished conversation.
+
+    With `structured`, the answer is requested as a JSON object (see
+    _OPINION_SCHEMA) instead of OPINION_A/OPINION_B lines. Runs from before
+    the layered prompt layout were scored with different wording (the
+    conversation first, under 'Given this conversation about "<topic>":').
+    """
+    if structured:
+        answer_format = ('Answer with a JSON object: {"a": <Agent A\'s updated score>, '
+                         '"b": <Agent B\'s updated score>}')
+    else:
+        answer_format = "OPINION_A: <float>\nOPINION_B: <float>"
+    agents = (
+        f"Agent A's reasoning: {rationale_a}\n"
+        f"Agent A's prior stance: {stance_a} (score: {opinion_a:.2f})\n\n"
+        f"Agent B's reasoning: {rationale_b}\n"
+        f"Agent B's prior stance: {stance_b} (score: {opinion_b:.2f})\n"
+    )
+    prompt = (
+        f"\nTheir conversation about this topic:\n"
+        f"{conversation}\n\n"
+        f"Based on the conversation, what is each agent's updated opinion?\n"
+        f"Each agent may shift their view if the other made a compelling argument, or hold firm if unconvinced.\n"
+        f"Score from -1.0 (strongly against) to 1.0 (strongly in favor).\n\n"
+        f"{answer_format}"
+    )
+    return _prompt_layers(_topic_block(topic), agents), prompt
+
+
+def _scoring_prompt(conversation, stance_a, opinion_a, rationale_a,
+                    stance_b, opinion_b, rationale_b, topic=None, structured=False):
+    """Build the symmetric scoring prompt for a finished conversation as one string."""
+    prefix, prompt = _scoring_layers(conversation, stance_a, opinion_a, rationale_a,
+                                     stance_b, opinion_b, rationale_b, topic, structured)
+    return "".join(prefix) + prompt
 
 
 def _extract_number(text):
@@ -592,3 +3540,132 @@ def _extract_number(text):
         if -1.0 <= val <= 1.0:
             return val
     return 0.0
+
+
+# ── Re-scoring recorded conversations ────────────────────────────────────────
+
+def _read_transcript(transcript_path):
+    """Parse a transcript into (topic, records) for re-scoring.
+
+    Each record is a dict with tick, agent_a, agent_b, prior_a, prior_b,
+    conversation, opinion_a and opinion_b.
+    """
+    topic = ""
+    records = []
+    record = None
+    with open(transcript_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("# Transcript:") and not records and record is None:
+                topic = line[len("# Transcript:"):].strip()
+                continue
+            m = re.match(r"^=== Tick (\d+) \| Agent (\d+) <-> Agent (\d+) ===", line)
+            if m:
+                record = {"tick": int(m.group(1)), "agent_a": int(m.group(2)),
+                          "agent_b": int(m.group(3)), "prior_a": None, "prior_b": None,
+                          "lines": []}
+                continue
+            if record is None:
+                continue
+            m = re.match(r"PRIOR_STANCE: A\(\d+\)=([-\d.]+), B\(\d+\)=([-\d.]+)", line)
+            if m:
+                record["prior_a"] = float(m.group(1))
+                record["prior_b"] = float(m.group(2))
+                continue
+            if line.startswith("TURNS_USED:"):
+                continue
+            m = re.match(r"Opinions after: A\(\d+\)=([-\d.]+), B\(\d+\)=([-\d.]+)", line)
+            if m:
+                record["opinion_a"] = float(m.group(1))
+                record["opinion_b"] = float(m.group(2))
+                record["conversation"] = "\n".join(record.pop("lines")).strip()
+                if record["prior_a"] is not None:
+                    records.append(record)
+                record = None
+                continue
+            record["lines"].append(line)
+    return topic, records
+
+
+def _prior_states(memory_dir):
+    """Read the stance and rationale each agent held before each of its conversations.
+
+    Returns {agent_id: [(stance, rationale), ...]}, where entry k is what the
+    agent's k-th conversation (in transcript order) was scored against — the
+    same text _get_current_stance and _get_current_rationale returned then.
+    """
+    states = {}
+    if not os.path.isdir(memory_dir):
+        return states
+    for fname in os.listdir(memory_dir):
+        m = re.match(r"agent_(\d+)\.txt", fname)
+        if not m:
+            continue
+        history = states[int(m.group(1))] = []
+        stance, rationale = "no stated opinion yet", ""
+        with open(os.path.join(memory_dir, fname), "r", encoding="utf-8") as f:
+            for line in f:
+                if re.match(r"\[Tick \d+\] Talked with agent \d+:", line):
+                    history.append((stance, rationale))
+                elif line.startswith("Stance:"):
+                    stance = line[len("Stance:"):].strip()
+                elif line.startswith("Rationale:"):
+                    rationale = line[len("Rationale:"):].strip()
+    return states
+
+
+def rescore_transcript(transcript_path, model="claude-haiku-4-5-20251001", output_path=None):
+    """Re-score every conversation in a transcript through the Message Batches API.
+
+    Writes a tab-separated table (default: rescored.tsv next to the transcript)
+    with the original and re-scored opinions, and returns its path. Scores that
+    cannot be parsed are left blank. Each conversation is scored against the
+    stances and rationales its agents held at the time, read back from the
+    run's agent memories.
+    The current scoring prompt is used, so transcripts recorded before the
+    layered prompt layout are rescored with different wording than they were
+    first scored with (see _scoring_layers).
+    """
+    global _claude_api_key
+    if not _claude_api_key:
+        _claude_api_key = _load_env().get("ANTHROPIC_API_KEY", "")
+    run_dir = os.path.dirname(transcript_path) or "."
+    if output_path is None:
+        output_path = os.path.join(run_dir, "rescored.tsv")
+
+    topic, records = _read_transcript(transcript_path)
+    states = _prior_states(os.path.join(run_dir, "agent_memories"))
+    seen = collections.Counter()
+
+    def prior_state(agent, prior):
+        # The agent's n-th transcript entry is its n-th conversation in memory
+        history = states.get(agent, [])
+        n = seen[agent]
+        seen[agent] += 1
+        return history[n] if n < len(history) else (f"Opinion score {prior:.2f}", "")
+
+    prompts = []
+    for r in records:
+        stance_a, rationale_a = prior_state(r["agent_a"], r["prior_a"])
+        stance_b, rationale_b = prior_state(r["agent_b"], r["prior_b"])
+        prompts.append(_scoring_prompt(r["conversation"],
+                                       stance_a, r["prior_a"], rationale_a,
+                                       stance_b, r["prior_b"], rationale_b, topic=topic))
+    print(f"[llm_helper] Re-scoring {len(prompts)} conversations from {transcript_path}")
+    responses = call_claude_batch(prompts, model=model, max_tokens=50)
+
+    failures = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("tick\tagent_a\tagent_b\tprior_a\tprior_b\topinion_a\topinion_b\t"
+                "rescored_a\trescored_b\n")
+        for r, response in zip(records, responses):
+            cleaned = re.sub(r"\*\*", "", response)
+            scores = [_match_tagged_opinion(tag, cleaned) for tag in ("OPINION_A", "OPINION_B")]
+            failures += scores.count(None)
+            rescored = ["" if v is None else f"{v:.3f}" for v in scores]
+            f.write(f"{r['tick']}\t{r['agent_a']}\t{r['agent_b']}\t"
+                    f"{r['prior_a']:.3f}\t{r['prior_b']:.3f}\t"
+                    f"{r['opinion_a']:.3f}\t{r['opinion_b']:.3f}\t"
+                    f"{rescored[0]}\t{rescored[1]}\n")
+    print(f"[llm_helper] Wrote {output_path} ({failures} unparsed scores)")
+    return output_path
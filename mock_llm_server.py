@@ -0,0 +1,637 @@
+"""Local stand-in for the LLM APIs used by llm_helper.py.
+
+Speaks enough of the Ollama API (/api/generate, streaming, KV-cache context
+and JSON-schema formats), the Anthropic Messages API (including streaming and
+prompt cache accounting), the Message Batches API and the OpenAI-compatible
+chat completions API to run the simulation with every backend offline.
+Replies are canned but well-formed and deterministic: the same prompt always
+gets the same answer.
+
+To benchmark llm_helper itself, the server can also behave like a loaded
+model server: latency drawn from a distribution plus a per-token generation
+rate, a limited number of parallel slots, a requests-per-minute limit, a
+model load delay, and injected errors and dropped connections. With --seed,
+the latencies and failures it draws are reproducible.
+
+Usage:
+    python mock_llm_server.py --port 8089 --batch-delay 5
+    python mock_llm_server.py --latency lognormal:0.4,0.5 --max-concurrency 4 --seed 1
+
+Then point llm_helper at it before starting NetLogo (any API key works):
+    export OLLAMA_URL=http://localhost:8089
+    export ANTHROPIC_BASE_URL=http://localhost:8089
+    export OPENAI_BASE_URL=http://localhost:8089/v1
+
+GET /mock/stats returns counters of what the server did.
+"""
+
+import argparse
+import collections
+import contextlib
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_TURNS = [
+    "I hold my position because the evidence I have seen points clearly one way.",
+    "That argument overlooks how the policy plays out for ordinary people.",
+    "You make a fair point, but the costs you describe are smaller than the benefits.",
+    "I see where you are coming from, yet my own experience tells a different story.",
+    "The data on this is mixed, so I would not be so certain about that claim.",
+    "If we followed your reasoning, the outcome would be worse for everyone involved.",
+    "You're right, and I have to admit that changes how I see this.",
+]
+
+_RATIONALES = [
+    "A close friend's experience convinced this character that the issue matters deeply.",
+    "Years of working in the community shaped this character's view on the matter.",
+    "This character weighs personal freedom against public safety and lands on this side.",
+]
+
+
+def _digest(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16)
+
+
+def canned_scores(prompt):
+    """Return deterministic opinion scores ({"a": float, "b": float}) for a scoring prompt."""
+    h = _digest(prompt)
+    return {"a": round((h % 2001) / 1000.0 - 1.0, 2),
+            "b": round(((h // 2001) % 2001) / 1000.0 - 1.0, 2)}
+
+
+def canned_response(prompt):
+    """Return a deterministic, well-formed reply for a simulation prompt."""
+    h = _digest(prompt)
+    if "A: <turn 1>" in prompt:
+        # A whole conversation in one call, maybe followed by its scores
+        lines = [f"{speaker}: {_TURNS[(h + i) % len(_TURNS)]}"
+                 for i, speaker in enumerate("ABAB")]
+        if "OPINION_A" in prompt:
+            scores = canned_scores(prompt)
+            lines += [f"OPINION_A: {scores['a']:.2f}", f"OPINION_B: {scores['b']:.2f}"]
+        return "\n".join(lines)
+    if "OPINION_A" in prompt:
+        scores = canned_scores(prompt)
+        return f"OPINION_A: {scores['a']:.2f}\nOPINION_B: {scores['b']:.2f}"
+    if "ONE specific sentence" in prompt:
+        return _RATIONALES[h % len(_RATIONALES)]
+    return _TURNS[h % len(_TURNS)]
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+_LATENCY_DISTRIBUTIONS = {
+    "fixed": (1, lambda rng, s: s),
+    "uniform": (2, lambda rng, low, high: rng.uniform(low, high)),
+    "normal": (2, lambda rng, mean, sd: max(0.0, rng.gauss(mean, sd))),
+    "lognormal": (2, lambda rng, median, sigma: median * rng.lognormvariate(0.0, sigma)),
+    "exponential": (1, lambda rng, mean: rng.expovariate(1.0 / mean) if mean > 0 else 0.0),
+    "tail": (3, lambda rng, base, slow, p: slow if rng.random() < p else base),
+}
+
+
+def parse_latency(spec):
+    """Turn a latency spec into a function of a random.Random that returns seconds.
+
+    Specs: "0.05" (or "fixed:0.05"), "uniform:LOW,HIGH", "normal:MEAN,SD",
+    "lognormal:MEDIAN,SIGMA", "exponential:MEAN", and "tail:BASE,SLOW,P"
+    (BASE seconds, but SLOW with probability P).
+    """
+    if callable(spec):
+        return spec
+    name, _, args = str(spec if spec is not None else "0").strip().partition(":")
+    if not args:
+        value = float(name)
+        return lambda rng: value
+    if name not in _LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"unknown latency distribution {name!r}")
+    arity, draw = _LATENCY_DISTRIBUTIONS[name]
+    values = [float(v) for v in args.split(",")]
+    if len(values) != arity:
+        raise ValueError(f"latency distribution {name!r} takes {arity} parameter(s)")
+    return lambda rng: draw(rng, *values)
+
+
+def _prompt_text(messages):
+    """Flatten the text of a Messages API message list."""
+    parts = []
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content
+                         if block.get("type") == "text")
+    return "\n".join(parts)
+
+
+def _cache_breakpoints(params):
+    """Return the prompt text up to each cache_control breakpoint, and the full prompt text."""
+    blocks = params.get("system", [])
+    if isinstance(blocks, str):
+        blocks = [{"type": "text", "text": blocks}]
+    for message in params.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        blocks = blocks + content
+    text = ""
+    breakpoints = []
+    for block in blocks:
+        text += block.get("text", "")
+        if block.get("cache_control"):
+            breakpoints.append(text)
+    return breakpoints, text
+
+
+def _claude_message(params, prompt_cache=None):
+    """Build a Messages API response for request parameters.
+
+    With a `prompt_cache` set, cache_control prefixes seen before are reported
+    as cache reads and new ones as cache writes, like the real prompt cache.
+    A forced tool call is answered with a tool_use block holding canned scores.
+    """
+    prompt = _prompt_text(params.get("messages", []))
+    text = canned_response(prompt)
+    content = [{"type": "text", "text": text}]
+    stop_reason = "end_turn"
+    tool_choice = params.get("tool_choice") or {}
+    if tool_choice.get("type") == "tool":
+        tool_input = canned_scores(prompt)
+        text = json.dumps(tool_input)
+        content = [{"type": "tool_use", "id": f"toolu_{_digest(prompt) % 10 ** 12:012d}",
+                    "name": tool_choice.get("name"), "input": tool_input}]
+        stop_reason = "tool_use"
+    breakpoints, full_text = _cache_breakpoints(params)
+    cached = written = 0
+    if prompt_cache is not None:
+        for prefix in breakpoints:
+            key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+            if key in prompt_cache:
+                cached = len(prefix)
+            else:
+                prompt_cache.add(key)
+                written = len(prefix) - cached
+                break
+    return {
+        "id": f"msg_{_digest(prompt) % 10 ** 12:012d}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "mock"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "usage": {"input_tokens": _estimate_tokens(full_text[cached + written:]),
+                  "output_tokens": _estimate_tokens(text),
+                  "cache_creation_input_tokens": written // 4,
+                  "cache_read_input_tokens": cached // 4},
+    }
+
+
+def _openai_completion(params):
+    """Build a chat completion response for request parameters."""
+    prompt = "\n".join(m.get("content", "") for m in params.get("messages", [])
+                       if m.get("role") != "system" and isinstance(m.get("content"), str))
+    text = canned_response(prompt)
+    if (params.get("response_format") or {}).get("type") in ("json_object", "json_schema"):
+        text = json.dumps(canned_scores(prompt))
+    prompt_tokens = _estimate_tokens(prompt)
+    completion_tokens = _estimate_tokens(text)
+    return {
+        "id": f"chatcmpl-{_digest(prompt) % 10 ** 12:012d}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": params.get("model", "mock"),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": text}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def _ollama_generation(params):
+    """Build an /api/generate response (without timings) for request parameters.
+
+    A request without a prompt only loads the model, as in Ollama. Returned
+    contexts grow by the prompt and response tokens, so KV-cache reuse can be
+    exercised; a `format` schema is answered with canned JSON scores.
+    """
+    prompt = params.get("prompt", "")
+    response = {"model": params.get("model", "mock"),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "response": "", "done": True}
+    if not prompt:
+        response["done_reason"] = "load"
+        return response
+    text = json.dumps(canned_scores(prompt)) if params.get("format") else canned_response(prompt)
+    context = list(params.get("context") or [])
+    evaluated = prompt if context else params.get("system", "") + prompt
+    prompt_tokens = _estimate_tokens(evaluated)
+    output_tokens = _estimate_tokens(text)
+    h = _digest(prompt)
+    context += [(h + i) % 32000 for i in range(prompt_tokens + output_tokens)]
+    response.update(response=text, done_reason="stop", context=context,
+                    prompt_eval_count=prompt_tokens, eval_count=output_tokens)
+    return response
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    # ── helpers ──
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+
+    def _send_body(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status, obj):
+        self._send_body(status, json.dumps(obj).encode("utf-8"), "application/json")
+
+    def _send_events(self, chunks, content_type="text/event-stream"):
+        """Send a chunked streaming response, each chunk already formatted."""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                chunk = chunk.encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _send_error_json(self, status, message, error_type="invalid_request_error",
+                         retry_after=None):
+        if self.path.startswith("/api/"):
+            error = {"error": message}
+        else:
+            error = {"type": "error", "error": {"type": error_type, "message": message}}
+        data = json.dumps(error).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if retry_after is not None:
+            self.send_header("Retry-After", f"{retry_after:g}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    # ── simulated load ──
+
+    def _admit(self):
+        """Apply the rate limit and failure injection to a generation request.
+
+        Returns False if the request has already been answered (or dropped).
+        """
+        server = self.server
+        with server.lock:
+            server.stats["requests"] += 1
+            now = time.monotonic()
+            if server.rpm:
+                window = server.request_times
+                while window and now - window[0] >= 60.0:
+                    window.popleft()
+                if len(window) >= server.rpm:
+                    server.stats["throttled"] += 1
+                    wait = 60.0 - (now - window[0])
+                    throttled = True
+                else:
+                    window.append(now)
+                    throttled = False
+            else:
+                throttled = False
+            roll = server.rng.random()
+        if throttled:
+            self._send_error_json(429, "rate limit exceeded", "rate_limit_error",
+                                  retry_after=round(wait, 1))
+            return False
+        if roll < server.drop_rate:
+            with server.lock:
+                server.stats["dropped"] += 1
+            self.close_connection = True
+            return False
+        if roll < server.drop_rate + server.error_rate:
+            with server.lock:
+                server.stats["injected_errors"] += 1
+            retry_after = server.retry_after if server.error_status in (429, 503, 529) else None
+            self._send_error_json(server.error_status, "injected failure", "api_error",
+                                  retry_after=retry_after)
+            return False
+        return True
+
+    def _generation_times(self):
+        """Draw (time to first token, time per output token) for one request."""
+        with self.server.lock:
+            first = self.server.latency(self.server.rng)
+        per_token = 1.0 / self.server.token_rate if self.server.token_rate else 0.0
+        return first, per_token
+
+    def _load_model(self, model):
+        """Simulate loading `model` once; return the seconds spent loading it."""
+        with self.server.lock:
+            if model in self.server.loaded_models or not self.server.load_time:
+                self.server.loaded_models.add(model)
+                return 0.0
+            self.server.loaded_models.add(model)
+        time.sleep(self.server.load_time)
+        return self.server.load_time
+
+    # ── routing ──
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_error_json(400, "request body is not valid JSON")
+            return
+        generate = {"/api/generate": self._ollama_generate,
+                    "/v1/messages": self._messages,
+                    "/v1/chat/completions": self._chat_completions}.get(self.path)
+        if generate is not None:
+            if not self._admit():
+                return
+            with self.server.slots:
+                with self.server.lock:
+                    self.server.stats["in_flight"] += 1
+                    self.server.stats["max_in_flight"] = max(self.server.stats["max_in_flight"],
+                                                             self.server.stats["in_flight"])
+                try:
+                    generate(body)
+                finally:
+                    with self.server.lock:
+                        self.server.stats["in_flight"] -= 1
+                        self.server.stats["completed"] += 1
+        elif self.path == "/v1/messages/batches":
+            self._create_batch(body)
+        else:
+            self._send_error_json(404, f"unknown endpoint {self.path}")
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-mock"})
+            return
+        if self.path == "/mock/stats":
+            with self.server.lock:
+                self._send_json(200, dict(self.server.stats))
+            return
+        m = re.match(r"^/v1/messages/batches/([\w-]+)(/results)?$", self.path)
+        if m and m.group(2):
+            self._batch_results(m.group(1))
+        elif m:
+            self._batch_status(m.group(1))
+        else:
+            self._send_error_json(404, f"unknown endpoint {self.path}")
+
+    # ── Ollama API ──
+
+    def _ollama_generate(self, params):
+        start = time.monotonic()
+        load = self._load_model(params.get("model", "mock"))
+        response = _ollama_generation(params)
+        first, per_token = self._generation_times()
+        if not params.get("prompt"):
+            first = per_token = 0.0
+        words = re.findall(r"\S+\s*", response["response"])
+        eval_time = per_token * response.get("eval_count", 0)
+        response.update(load_duration=int(load * 1e9),
+                        prompt_eval_duration=int(first * 1e9),
+                        eval_duration=int(eval_time * 1e9))
+        if params.get("stream") is False or not words:
+            time.sleep(first + eval_time)
+            response["total_duration"] = int((time.monotonic() - start) * 1e9)
+            self._send_json(200, response)
+            return
+
+        def chunks():
+            time.sleep(first)
+            for word in words:
+                time.sleep(per_token * _estimate_tokens(word))
+                yield json.dumps({"model": response["model"], "created_at": response["created_at"],
+                                  "response": word, "done": False}) + "\n"
+            response["total_duration"] = int((time.monotonic() - start) * 1e9)
+            yield json.dumps(dict(response, response="")) + "\n"
+
+        self._send_events(chunks(), "application/x-ndjson")
+
+    # ── Messages API ──
+
+    def _messages(self, params):
+        with self.server.lock:
+            message = _claude_message(params, self.server.prompt_cache)
+        first, per_token = self._generation_times()
+        if not params.get("stream"):
+            time.sleep(first + per_token * message["usage"]["output_tokens"])
+            self._send_json(200, message)
+            return
+        text = message["content"][0]["text"]
+        events = [
+            ("message_start", {"type": "message_start",
+                               "message": dict(message, content=[])}),
+            ("content_block_start", {"type": "content_block_start", "index": 0,
+                                     "content_block": {"type": "text", "text": ""}}),
+        ]
+        for word in re.findall(r"\S+\s*", text):
+            events.append(("content_block_delta", {
+                "type": "content_block_delta", "index": 0,
+                "delta": {"type": "text_delta", "text": word}}))
+        events += [
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {"type": "message_delta",
+                               "delta": {"stop_reason": "end_turn"},
+                               "usage": {"output_tokens": message["usage"]["output_tokens"]}}),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+        self._send_events(self._paced(
+            [f"event: {name}\ndata: {json.dumps(event)}\n\n" for name, event in events],
+            first, per_token))
+
+    def _paced(self, chunks, first, per_token):
+        """Yield streaming chunks after the first-token delay, one token-time apart."""
+        time.sleep(first)
+        for chunk in chunks:
+            yield chunk
+            time.sleep(per_token)
+
+    # ── OpenAI-compatible chat completions ──
+
+    def _chat_completions(self, params):
+        completion = _openai_completion(params)
+        output_tokens = completion["usage"]["completion_tokens"]
+        first, per_token = self._generation_times()
+        if not params.get("stream"):
+            time.sleep(first + per_token * output_tokens)
+            self._send_json(200, completion)
+            return
+        base = {"id": completion["id"], "object": "chat.completion.chunk",
+                "created": completion["created"], "model": completion["model"]}
+        text = completion["choices"][0]["message"]["content"]
+        chunks = [dict(base, choices=[{"index": 0, "finish_reason": None,
+                                       "delta": {"role": "assistant", "content": word}}])
+                  for word in re.findall(r"\S+\s*", text)]
+        chunks.append(dict(base, choices=[{"index": 0, "finish_reason": "stop", "delta": {}}]))
+        if (params.get("stream_options") or {}).get("include_usage"):
+            chunks.append(dict(base, choices=[], usage=completion["usage"]))
+        self._send_events(self._paced(
+            [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks] + ["data: [DONE]\n\n"],
+            first, per_token))
+
+    # ── Message Batches API ──
+
+    def _create_batch(self, body):
+        requests = body.get("requests", [])
+        if not requests:
+            self._send_error_json(400, "requests must not be empty")
+            return
+        with self.server.lock:
+            self.server.batch_counter += 1
+            batch_id = f"msgbatch_mock{self.server.batch_counter:06d}"
+            self.server.batches[batch_id] = {"created": time.time(), "requests": requests}
+        self._send_json(200, self._batch_object(batch_id))
+
+    def _batch_object(self, batch_id):
+        batch = self.server.batches[batch_id]
+        ended = time.time() - batch["created"] >= self.server.batch_delay
+        count = len(batch["requests"])
+        host = self.headers.get("Host", "%s:%d" % self.server.server_address[:2])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else count,
+                               "succeeded": count if ended else 0,
+                               "errored": 0, "canceled": 0, "expired": 0},
+            "results_url": f"http://{host}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _batch_status(self, batch_id):
+        if batch_id not in self.server.batches:
+            self._send_error_json(404, f"no batch {batch_id}")
+            return
+        self._send_json(200, self._batch_object(batch_id))
+
+    def _batch_results(self, batch_id):
+        batch = self.server.batches.get(batch_id)
+        if batch is None or self._batch_object(batch_id)["processing_status"] != "ended":
+            self._send_error_json(404, f"no results for batch {batch_id}")
+            return
+        lines = []
+        for request in batch["requests"]:
+            with self.server.lock:
+                message = _claude_message(request["params"], self.server.prompt_cache)
+            result = {"type": "succeeded", "message": message}
+            lines.append(json.dumps({"custom_id": request["custom_id"], "result": result}))
+        self._send_body(200, ("\n".join(lines) + "\n").encode("utf-8"), "application/x-jsonl")
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """Mock LLM server.
+
+    latency: time to first token, as a spec for parse_latency or a function
+             of a random.Random; token_rate: output tokens per second (0 =
+             instant); max_concurrency: parallel generation slots, further
+             requests queue (None = unlimited); rpm: requests per minute
+             before 429s (0 = unlimited); error_rate / drop_rate: share of
+             requests answered with error_status or dropped without a
+             response; load_time: seconds to "load" each model on first use.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, batch_delay=2.0, verbose=False, latency=0.0, token_rate=0.0,
+                 max_concurrency=None, rpm=0, error_rate=0.0, error_status=503,
+                 retry_after=1.0, drop_rate=0.0, load_time=0.0, seed=None):
+        super().__init__(address, MockLLMHandler)
+        self.batch_delay = batch_delay
+        self.verbose = verbose
+        self.latency = parse_latency(latency)
+        self.token_rate = token_rate
+        self.slots = (threading.BoundedSemaphore(max_concurrency) if max_concurrency
+                      else contextlib.nullcontext())
+        self.rpm = rpm
+        self.request_times = collections.deque()
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.drop_rate = drop_rate
+        self.load_time = load_time
+        self.loaded_models = set()
+        self.rng = random.Random(seed)
+        self.stats = collections.Counter()
+        self.lock = threading.Lock()
+        self.batches = {}
+        self.batch_counter = 0
+        self.prompt_cache = set()
+
+
+def start_server(host="127.0.0.1", port=0, **options):
+    """Start a mock server on a background thread and return it.
+
+    Use port=0 to pick a free port (see server.server_address); stop it with
+    server.shutdown().
+    """
+    server = MockLLMServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the LLM APIs.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8089, help="Port to listen on (default: 8089)")
+    parser.add_argument("--batch-delay", type=float, default=2.0,
+                        help="Seconds before a submitted batch ends (default: 2)")
+    parser.add_argument("--latency", default="0",
+                        help="Time to first token: seconds, or a distribution such as "
+                             "uniform:0.1,0.5, lognormal:0.3,0.5, exponential:0.3 or "
+                             "tail:0.2,5,0.02 (default: 0)")
+    parser.add_argument("--token-rate", type=float, default=0.0,
+                        help="Output tokens generated per second (default: 0 = instant)")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="Parallel generation slots; extra requests queue (default: unlimited)")
+    parser.add_argument("--rpm", type=int, default=0,
+                        help="Requests per minute before answering 429 (default: 0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of requests answered with --error-status (default: 0)")
+    parser.add_argument("--error-status", type=int, default=503,
+                        help="HTTP status of injected errors (default: 503)")
+    parser.add_argument("--retry-after", type=float, default=1.0,
+                        help="Retry-After seconds sent with injected 429/503/529s (default: 1)")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="Share of requests whose connection is closed without a response")
+    parser.add_argument("--load-time", type=float, default=0.0,
+                        help="Seconds to load each Ollama model on first use (default: 0)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for the latencies and failures drawn (default: unseeded)")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = MockLLMServer((args.host, args.port), batch_delay=args.batch_delay,
+                           verbose=args.verbose, latency=args.latency,
+                           token_rate=args.token_rate, max_concurrency=args.max_concurrency,
+                           rpm=args.rpm, error_rate=args.error_rate,
+                           error_status=args.error_status, retry_after=args.retry_after,
+                           drop_rate=args.drop_rate, load_time=args.load_time, seed=args.seed)
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
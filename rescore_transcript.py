@@ -0,0 +1,27 @@
+"""Re-score every conversation in a transcript through the Message Batches API.
+
+Rebuilds the symmetric scoring prompt for each recorded conversation, submits
+them all as Claude message batches, and writes the original and re-scored
+opinions side by side to rescored.tsv in the run directory.
+"""
+
+import argparse
+import os
+import llm_helper
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Re-score recorded conversations with the Claude Message Batches API."
+    )
+    parser.add_argument("transcript", nargs="?", default="transcript.txt",
+                        help="Path to transcript.txt (default: transcript.txt)")
+    parser.add_argument("--model", default="claude-haiku-4-5-20251001",
+                        help="Claude model ID (default: claude-haiku-4-5-20251001)")
+    parser.add_argument("--output", default=None,
+                        help="Output path (default: rescored.tsv next to the transcript)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.transcript):
+        parser.error(f"transcript not found: {args.transcript}")
+    llm_helper.rescore_transcript(args.transcript, model=args.model, output_path=args.output)
@@ -0,0 +1,289 @@
+"""Checks of llm_helper's client behaviour against mock_llm_server.
+
+Run with `python -m pytest -q`. Every test starts its own mock server on a
+free port, so no LLM backend or API key is needed.
+"""
+
+import csv
+import glob
+import os
+import threading
+import time
+
+import pytest
+
+import llm_helper
+import mock_llm_server
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    """Give each test its own run directory and fresh client state."""
+    for name in ("_retry_max_attempts", "_retry_base_delay", "_retry_max_delay",
+                 "_request_timeout", "_call_deadline", "_breaker_threshold",
+                 "_breaker_cooldown", "_eject_after", "_health_interval",
+                 "_batch_poll_interval", "_ollama_endpoints", "_claude_url",
+                 "_claude_api_key", "_openai_url", "_backend", "_model",
+                 "_scoring_mode", "_response_cache"):
+        monkeypatch.setattr(llm_helper, name, getattr(llm_helper, name))
+    monkeypatch.setattr(llm_helper, "SCRIPT_DIR", str(tmp_path))
+    monkeypatch.setattr(llm_helper, "_breakers", {})
+    monkeypatch.setattr(llm_helper, "_claude_limiter", llm_helper._RateLimiter(0, 0, 0))
+    monkeypatch.setattr(llm_helper, "_backend", "ollama")
+    monkeypatch.setattr(llm_helper, "_model", "mock")
+    monkeypatch.setattr(llm_helper, "_response_cache", None)
+    llm_helper.configure_retry(base_delay=0.01, max_delay=0.05, request_timeout=5)
+    with llm_helper._metrics_lock:
+        llm_helper._metrics.clear()
+    (tmp_path / ".env").write_text("ANTHROPIC_API_KEY=test-key\n", encoding="utf-8")
+    yield tmp_path
+    llm_helper.finish_conversations()
+    if llm_helper._response_cache is not None:
+        llm_helper._response_cache.close()
+
+
+@pytest.fixture
+def mock_server():
+    """Start mock servers with the given options; all are shut down afterwards."""
+    servers = []
+
+    def start(**options):
+        server = mock_llm_server.start_server(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _url(server):
+    return "http://127.0.0.1:%d" % server.server_address[1]
+
+
+def _use_claude(server):
+    llm_helper._backend = "claude"
+    llm_helper._claude_url = _url(server)
+    llm_helper._claude_api_key = "test-key"
+
+
+# ── Circuit breaker ──────────────────────────────────────────────────────────
+
+def test_breaker_opens_then_probe_closes_it(mock_server):
+    server = mock_server(error_rate=1.0, error_status=500)
+    llm_helper.configure_ollama_endpoints(_url(server))
+    llm_helper.configure_retry(max_attempts=1, breaker_threshold=2, breaker_cooldown=0.2)
+    breaker = llm_helper._breaker("ollama")
+
+    assert llm_helper.call_llm("one") == ""
+    assert llm_helper.call_llm("two") == ""
+    assert breaker.state == "open"
+    assert llm_helper.get_metrics()["breaker_opened"] == 1
+
+    # While open, calls fail fast without reaching the server
+    sent = server.stats["requests"]
+    assert llm_helper.call_llm("three") == ""
+    assert server.stats["requests"] == sent
+
+    # After the cooldown one probe goes through, and its success closes the breaker
+    server.error_rate = 0.0
+    time.sleep(0.25)
+    assert llm_helper.call_llm("four")
+    assert breaker.state == "closed"
+
+
+def test_stream_closed_early_closes_breaker(mock_server):
+    server = mock_server()
+    llm_helper.configure_ollama_endpoints(_url(server))
+    llm_helper.configure_retry(breaker_threshold=1, breaker_cooldown=0.1)
+    breaker = llm_helper._breaker("ollama")
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.15)
+
+    stream = llm_helper.call_llm_stream("tell me something")
+    assert next(stream)
+    stream.close()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.parametrize("status", [429, 529])
+def test_throttling_is_retried_without_tripping_breaker(mock_server, status):
+    server = mock_server(error_rate=0.5, error_status=status, retry_after=0.01, seed=3)
+    _use_claude(server)
+    llm_helper.configure_retry(max_attempts=8, breaker_threshold=2)
+
+    for i in range(6):
+        assert llm_helper.call_llm(f"prompt {i}")
+        assert "".join(llm_helper.call_llm_stream(f"stream {i}"))
+    assert server.stats["injected_errors"] > 0
+    assert llm_helper.get_metrics()["throttled"] == server.stats["injected_errors"]
+    assert llm_helper._breaker("claude").state == "closed"
+
+
+# ── Ollama endpoint pool ─────────────────────────────────────────────────────
+
+def test_pool_spreads_concurrent_requests(mock_server):
+    servers = [mock_server(latency="0.05") for _ in range(2)]
+    llm_helper.configure_ollama_endpoints([_url(s) for s in servers])
+
+    threads = [threading.Thread(target=llm_helper.call_llm, args=(f"prompt {i}",))
+               for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = llm_helper.get_endpoint_stats()
+    assert [e["requests"] for e in stats] == [4, 4]
+    assert all(e["outstanding"] == 0 for e in stats)
+
+
+def test_pool_ejects_failing_endpoint(mock_server, monkeypatch):
+    monkeypatch.setattr(llm_helper, "_health_interval", 60)
+    bad = mock_server(error_rate=1.0, error_status=500)
+    good = mock_server()
+    llm_helper.configure_ollama_endpoints([_url(bad), _url(good)])
+    llm_helper.configure_retry(breaker_threshold=100)
+
+    for i in range(10):
+        assert llm_helper.call_llm(f"prompt {i}")
+
+    stats = {e["url"]: e for e in llm_helper.get_endpoint_stats()}
+    assert not stats[_url(bad)]["healthy"]
+    assert stats[_url(bad)]["failures"] == llm_helper._eject_after
+    assert stats[_url(good)]["healthy"]
+    assert llm_helper.get_metrics()["endpoint_ejections"] == 1
+
+
+def test_kv_context_stays_on_its_endpoint(mock_server):
+    servers = [mock_server() for _ in range(3)]
+    llm_helper.configure_ollama_endpoints([_url(s) for s in servers])
+
+    text, context, _ = llm_helper.call_ollama_context("first turn")
+    assert text and context.endpoint
+    home = context.endpoint
+    for i in range(5):
+        text, context, _ = llm_helper.call_ollama_context(f"turn {i}", context)
+        assert text
+        assert context.endpoint == home
+
+
+# ── Response cache ───────────────────────────────────────────────────────────
+
+def test_response_cache_hits_skip_the_server(mock_server, tmp_path):
+    server = mock_server()
+    llm_helper.configure_ollama_endpoints(_url(server))
+    llm_helper.configure_response_cache(str(tmp_path / "cache.sqlite3"))
+
+    first = llm_helper.call_llm("cached prompt")
+    sent = server.stats["requests"]
+    assert llm_helper.call_llm("cached prompt") == first
+    assert server.stats["requests"] == sent
+    stats = llm_helper.get_response_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+    # use_cache=False always asks the server
+    llm_helper.call_llm("cached prompt", use_cache=False)
+    assert server.stats["requests"] == sent + 1
+
+
+def test_response_cache_stays_within_its_size_limit(mock_server, tmp_path):
+    server = mock_server()
+    llm_helper.configure_ollama_endpoints(_url(server))
+    llm_helper.configure_response_cache(str(tmp_path / "cache.sqlite3"), max_bytes=400)
+
+    for i in range(10):
+        llm_helper.call_llm(f"prompt {i}")
+    stats = llm_helper.get_response_cache_stats()
+    assert stats["evictions"] > 0
+    assert stats["bytes"] <= 400
+
+
+# ── Message Batches ──────────────────────────────────────────────────────────
+
+def test_batch_results_come_back_in_order(mock_server, monkeypatch):
+    server = mock_server(batch_delay=0.05)
+    _use_claude(server)
+    monkeypatch.setattr(llm_helper, "_batch_poll_interval", 0.02)
+
+    prompts = [f"Say something about item {i}" for i in range(5)]
+    texts = llm_helper.call_claude_batch(prompts, max_tokens=50)
+    assert texts == [llm_helper.call_claude(p, max_tokens=50) for p in prompts]
+    assert all(texts)
+
+
+def test_batch_skips_malformed_result_lines(mock_server, monkeypatch):
+    server = mock_server(batch_delay=0.05)
+    _use_claude(server)
+    monkeypatch.setattr(llm_helper, "_batch_poll_interval", 0.02)
+    send_body = mock_llm_server.MockLLMHandler._send_body
+
+    def corrupt(self, status, data, content_type):
+        if content_type == "application/x-jsonl":
+            data = (b"not json\n"
+                    b'{"custom_id": "req-x", "result": {}}\n'
+                    b'{"custom_id": "req-99", "result": {"type": "succeeded"}}\n'
+                    b'{"result": {"type": "succeeded"}}\n' + data)
+        send_body(self, status, data, content_type)
+
+    monkeypatch.setattr(mock_llm_server.MockLLMHandler, "_send_body", corrupt)
+    texts = llm_helper.call_claude_batch(["alpha", "beta"], max_tokens=50)
+    assert len(texts) == 2 and all(texts)
+
+
+# ── Rescoring ────────────────────────────────────────────────────────────────
+
+def test_rescoring_uses_the_live_scoring_prompts(mock_server, monkeypatch, tmp_path):
+    server = mock_server(batch_delay=0.05)
+    llm_helper._claude_url = _url(server)
+    monkeypatch.setattr(llm_helper, "_batch_poll_interval", 0.02)
+    llm_helper.setup_agents(4, "school uniforms", "mock", backend="claude", seed=7)
+
+    live = []
+    call_llm = llm_helper.call_llm
+
+    def recording_call_llm(prompt, *args, prefix=None, **kwargs):
+        if "OPINION_A:" in prompt:
+            live.append("".join(prefix or []) + prompt)
+        return call_llm(prompt, *args, prefix=prefix, **kwargs)
+
+    monkeypatch.setattr(llm_helper, "call_llm", recording_call_llm)
+    for tick, (a, b) in enumerate([(0, 1), (2, 3), (1, 2), (0, 3)], start=1):
+        llm_helper.run_conversation(a, b, tick)
+
+    rescored = []
+    call_claude_batch = llm_helper.call_claude_batch
+
+    def recording_batch(prompts, *args, **kwargs):
+        rescored.extend(prompts)
+        return call_claude_batch(prompts, *args, **kwargs)
+
+    monkeypatch.setattr(llm_helper, "call_claude_batch", recording_batch)
+    output = llm_helper.rescore_transcript(llm_helper.TRANSCRIPT_PATH)
+
+    assert len(live) == 4
+    assert rescored == live
+    with open(output, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    assert len(rows) == 4
+    assert all(row["rescored_a"] and row["rescored_b"] for row in rows)
+
+
+# ── OpenAI-compatible backend ────────────────────────────────────────────────
+
+@pytest.mark.parametrize("scoring_mode", ["text", "stream", "json"])
+def test_openai_backend_runs_conversations(mock_server, tmp_path, scoring_mode):
+    server = mock_server()
+    llm_helper._openai_url = _url(server) + "/v1"
+    llm_helper.setup_agents(3, "remote work", "mock", backend="openai",
+                            openai_model="mock-instruct", scoring_mode=scoring_mode)
+
+    result = llm_helper.run_conversation(0, 1, 1)
+    assert -1.0 <= result["opinion_a"] <= 1.0 and -1.0 <= result["opinion_b"] <= 1.0
+    assert llm_helper._parse_failures == 0
+    assert llm_helper.get_usage_stats()["output_tokens"] > 0
+    transcript = glob.glob(os.path.join(str(tmp_path), "runs", "*", "transcript.txt"))
+    with open(transcript[0], encoding="utf-8") as f:
+        assert "=== Tick 1 | Agent 0 <-> Agent 1 ===" in f.read()